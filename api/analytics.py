@@ -0,0 +1,75 @@
+from typing import Annotated, List
+from app.core.analytics import catch_up
+from app.core.sketch import summarize
+from models.models import AnalyticsDimension, AnalyticsSummary, MissionTemplate, User
+from beanie import PydanticObjectId
+from beanie.operators import In
+from fastapi import APIRouter, HTTPException, Query, Request
+
+
+analytics_router = APIRouter(prefix="/analytics")
+
+
+def parse_percentiles(value: str) -> List[float]:
+    try:
+        percentiles = [float(part) / 100 for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(400, "Invalid percentiles")
+    if not percentiles or any(not 0 <= q <= 1 for q in percentiles):
+        raise HTTPException(400, "Percentiles must be between 0 and 100")
+    return percentiles
+
+
+def _summary(summary: AnalyticsSummary, qs: List[float]) -> dict:
+    with_plan = summary.on_time + summary.early + summary.late
+    return {
+        "missions": summary.missions,
+        "steps": summary.steps,
+        "adherence": {
+            "on_time": summary.on_time,
+            "early": summary.early,
+            "late": summary.late,
+            "on_time_rate": summary.on_time / with_plan if with_plan else None,
+        },
+        "start_delay": summarize(summary.start_delay, qs),
+        "duration": summarize(summary.duration, qs),
+        "overrun": summarize(summary.overrun, qs),
+        "mission_duration": summarize(summary.mission_duration, qs),
+    }
+
+
+@analytics_router.get("/")
+async def get_analytics(
+    request: Request,
+    percentiles: Annotated[str, Query(description="Comma separated, e.g. 50,90,95")] = "50,90,95",
+):
+    """
+    After-action review of the user's completed missions: start delays,
+    schedule adherence and durations, overall, per template and per step
+    type. Times are in seconds. Served from the materialized summaries.
+    """
+    user: User = request.state.user
+    qs = parse_percentiles(percentiles)
+
+    await catch_up(user.id)
+    summaries = await AnalyticsSummary.find(AnalyticsSummary.operator == user.id).to_list()
+
+    template_ids = [
+        PydanticObjectId(summary.key) for summary in summaries
+        if summary.dimension == AnalyticsDimension.TEMPLATE
+    ]
+    templates = {}
+    if template_ids:
+        found = await MissionTemplate.find(In(MissionTemplate.id, template_ids)).to_list()
+        templates = {str(template.id): template.name for template in found}
+
+    result = {"overall": None, "templates": [], "step_types": []}
+    for summary in summaries:
+        data = _summary(summary, qs)
+        if summary.dimension == AnalyticsDimension.OVERALL:
+            result["overall"] = data
+        elif summary.dimension == AnalyticsDimension.TEMPLATE:
+            result["templates"].append({"template_id": summary.key, "name": templates.get(summary.key), **data})
+        else:
+            result["step_types"].append({"step_type": summary.key, **data})
+    return result
@@ -2,8 +2,9 @@ from app.core.jwt import FastJWT
 from models.models import User
 from app.core.password_utils import get_password_hash, verify_password
 from beanie import PydanticObjectId
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
 
 
 class AuthSchema(BaseModel):
@@ -26,16 +27,19 @@ async def signup_event(payload: AuthSchema) -> UserOut:
     
     user: User = User(
         username=payload.username,
-        password=get_password_hash(payload.password),
+        password=await get_password_hash(payload.password),
     )
-    user: User = await user.insert()
+    try:
+        user: User = await user.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username already registered")
     return UserOut(id=user.id, username=user.username)
 
 
 @auth_router.post("/signin")
 async def signin_event(payload: AuthSchema):
     user = await User.find_one({"username": payload.username})
-    if not user or not verify_password(payload.password, user.password):
+    if not user or not await verify_password(payload.password, user.password):
         raise HTTPException(status_code=401, detail="Bad username or password")
 
     jwt_token = await FastJWT().encode(optional_data={
@@ -47,19 +51,13 @@ async def signin_event(payload: AuthSchema):
 
 
 # TODO: hould this be a private router instead?
-@auth_router.get("/me", response_model=UserOut)
+@auth_router.get("/me", response_model=UserOut, dependencies=[Depends(FastJWT().login_required)])
 async def me_event(request: Request) -> UserOut:
-    token: dict = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
     return UserOut(id=user.id, username=user.username)
 
 
-@auth_router.get("/verify")
+@auth_router.get("/verify", dependencies=[Depends(FastJWT().login_required)])
 async def verify_event(request: Request):
-    token: dict = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
     return {"status": "valid"}
\ No newline at end of file
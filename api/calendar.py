@@ -0,0 +1,504 @@
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import format_datetime as http_date, parsedate_to_datetime
+from typing import Annotated, AsyncIterator, Dict, List, Optional, Set, Tuple
+from api.mission import CreateMissionSchema
+from api.step import CreateStepSchema
+from app.core.config import config
+from app.core.events import MissionChange, mission_changed, on_mission_change
+from app.core.ics import Event, ICSError, content_line, escape, format_datetime, iter_events
+from app.core.jwt import FastJWT
+from models.models import CalendarFeedVersion, CalendarSource, Location, Mission, MissionStatus, Step, StepStatus, User
+from beanie import PydanticObjectId
+from beanie.operators import In
+from fastapi import APIRouter, Depends, File, Form, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Errors listed in the import report; the rest are only counted.
+MAX_REPORTED_ERRORS = 20
+
+# Missions per $in query for their steps while streaming the feed.
+FEED_BATCH_SIZE = 200
+
+# Attempts at bumping a feed version, with exponential backoff from FEED_BUMP_BACKOFF seconds.
+FEED_BUMP_ATTEMPTS = 5
+FEED_BUMP_BACKOFF = 0.2
+
+# Authenticated per route: the feed also accepts a calendar token in the query.
+calendar_router = APIRouter(prefix="/mission")
+
+_version_bumps: set = set()
+
+
+async def _bump_feed_version(operator: PydanticObjectId):
+    """
+    Retried: a lost bump would leave subscribers on a stale feed, answered
+    with 304s, until the operator's next write.
+    """
+    for attempt in range(FEED_BUMP_ATTEMPTS):
+        try:
+            await CalendarFeedVersion.get_pymongo_collection().update_one(
+                {"_id": operator}, {"$inc": {"version": 1}, "$currentDate": {"modified": True}}, upsert=True
+            )
+            return
+        except Exception:
+            if attempt == FEED_BUMP_ATTEMPTS - 1:
+                logger.exception("Failed to bump the calendar feed version of %s, giving up", operator)
+                return
+            logger.warning("Failed to bump the calendar feed version of %s, retrying", operator, exc_info=True)
+            await asyncio.sleep(FEED_BUMP_BACKOFF * 2 ** attempt)
+
+
+@on_mission_change
+def bump_feed_version(change: MissionChange):
+    # Runs after the write it follows, so a feed never carries a version
+    # newer than its content.
+    task = asyncio.create_task(_bump_feed_version(change.operator_id))
+    _version_bumps.add(task)
+    task.add_done_callback(_version_bumps.discard)
+
+
+async def feed_version(operator: PydanticObjectId) -> Tuple[str, datetime]:
+    """
+    (ETag, Last-Modified) of an operator's feed: one read by _id, the same on
+    every worker until the next mission/step write. Operators without writes
+    since versions were introduced are at version 0, modified when created.
+    """
+    feed = await CalendarFeedVersion.get_pymongo_collection().find_one({"_id": operator})
+    if feed is None:
+        version, modified = 0, operator.generation_time
+    else:
+        version, modified = feed["version"], feed["modified"].replace(tzinfo=timezone.utc)
+    modified = modified.replace(microsecond=0)
+    return f'"{version}-{int(modified.timestamp())}"', modified
+
+
+def event_hash(*fields) -> str:
+    return hashlib.sha1(repr(fields).encode("utf-8")).hexdigest()
+
+
+class CalendarImport:
+    """
+    Diff of one calendar feed against the missions previously imported from it.
+
+    Top-level VEVENTs become missions; events with a RELATED-TO parent become
+    steps of the parent's mission, ordered by start time after the existing
+    steps. Events are keyed by UID (and RECURRENCE-ID), unchanged ones are
+    skipped, new ones are written with insert_many and changed ones with
+    bulk updates, `config.ICS_IMPORT_BATCH_SIZE` at a time.
+    """
+
+    def __init__(self, operator: PydanticObjectId, feed: str):
+        self.operator = operator
+        self.feed = feed
+        self.batch_size = config.ICS_IMPORT_BATCH_SIZE
+
+        # uid -> {"_id", "name", "status", "hash"} of missions in the feed
+        self.missions: Dict[str, dict] = {}
+        # uid -> {"_id", "mission_id", "status", "hash"} of their steps
+        self.steps: Dict[str, dict] = {}
+        self.existing_missions: Set[str] = set()
+        self.names: Set[str] = set()
+
+        self.seen: Set[str] = set()
+        self.children: List[dict] = []
+        self.new_missions: List[Mission] = []
+        self.mission_updates: List[UpdateOne] = []
+
+        self.report = {
+            "missions": {"created": 0, "updated": 0, "unchanged": 0, "deleted": 0},
+            "steps": {"created": 0, "updated": 0, "unchanged": 0, "deleted": 0},
+            "errors": [],
+            "error_count": 0,
+        }
+
+    def error(self, key: Optional[str], message: str):
+        self.report["error_count"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"uid": key, "error": message})
+
+    async def load(self):
+        missions = Mission.get_pymongo_collection()
+        cursor = missions.find(
+            {"operator": self.operator, "calendar.feed": self.feed, "calendar.uid": {"$exists": True}},
+            {"name": 1, "status": 1, "calendar": 1},
+        )
+        async for doc in cursor:
+            self.missions[doc["calendar"]["uid"]] = {
+                "_id": doc["_id"], "name": doc["name"], "status": doc["status"], "hash": doc["calendar"]["hash"],
+            }
+        self.existing_missions = set(self.missions)
+        self.names = set(await missions.distinct("name", {"operator": self.operator}))
+
+        mission_ids = [mission["_id"] for mission in self.missions.values()]
+        if mission_ids:
+            cursor = Step.get_pymongo_collection().find(
+                {"mission_id": {"$in": mission_ids}, "calendar.uid": {"$exists": True}},
+                {"mission_id": 1, "status": 1, "calendar": 1},
+            )
+            async for doc in cursor:
+                self.steps[doc["calendar"]["uid"]] = {
+                    "_id": doc["_id"], "mission_id": doc["mission_id"],
+                    "status": doc["status"], "hash": doc["calendar"]["hash"],
+                }
+
+    def unique_name(self, name: str, start: Optional[datetime]) -> str:
+        """Mission names are unique per operator; suffix clashes with the event date."""
+        candidate = name
+        if candidate in self.names and start:
+            candidate = f"{name} ({start:%Y-%m-%d})"
+        number = 2
+        while candidate in self.names:
+            candidate = f"{name} ({number})"
+            number += 1
+        self.names.add(candidate)
+        return candidate
+
+    async def add(self, event: Event):
+        key = event.key
+        if not key:
+            self.error(None, "Event without UID")
+            return
+        if key in self.seen:
+            return
+        self.seen.add(key)
+
+        try:
+            name = (event.get("SUMMARY") or "").strip() or "Untitled"
+            start, end = event.start, event.end
+        except ICSError as e:
+            self.error(key, str(e))
+            return
+
+        if event.parent:
+            self.children.append({
+                "key": key, "parent": event.parent, "name": name, "start": start, "end": end,
+                "location": (event.get("LOCATION") or "").strip() or None,
+            })
+            return
+
+        cancelled = (event.get("STATUS") or "").upper() == "CANCELLED"
+        summary = event.get("DESCRIPTION")
+        digest = event_hash(name, start, end, summary, cancelled)
+        try:
+            CreateMissionSchema(name=name, start_time=start, end_time=end)
+        except ValidationError as e:
+            self.error(key, str(e))
+            return
+
+        existing = self.missions.get(key)
+        if existing:
+            if existing["hash"] == digest:
+                self.report["missions"]["unchanged"] += 1
+                return
+            changes = {"start_time": start, "end_time": end, "summary": summary, "calendar.hash": digest}
+            if name != existing["name"] and not existing["name"].startswith(f"{name} ("):
+                self.names.discard(existing["name"])
+                changes["name"] = self.unique_name(name, start)
+            if cancelled and existing["status"] == MissionStatus.PLANNED.value:
+                changes["status"] = existing["status"] = MissionStatus.CANCELLED.value
+            self.mission_updates.append(UpdateOne({"_id": existing["_id"]}, {"$set": changes}))
+            existing["hash"] = digest
+            self.report["missions"]["updated"] += 1
+        else:
+            mission = Mission(
+                id=PydanticObjectId(),
+                name=self.unique_name(name, start),
+                operator=self.operator,
+                start_time=start,
+                end_time=end,
+                summary=summary,
+                status=MissionStatus.CANCELLED if cancelled else MissionStatus.PLANNED,
+                calendar=CalendarSource(feed=self.feed, uid=key, hash=digest),
+            )
+            self.new_missions.append(mission)
+            self.missions[key] = {"_id": mission.id, "name": mission.name, "status": mission.status.value, "hash": digest}
+            self.report["missions"]["created"] += 1
+
+        if len(self.new_missions) + len(self.mission_updates) >= self.batch_size:
+            await self.flush_missions()
+
+    async def flush_missions(self):
+        if self.new_missions:
+            await Mission.insert_many(self.new_missions)
+            self.new_missions = []
+        if self.mission_updates:
+            await Mission.get_pymongo_collection().bulk_write(self.mission_updates, ordered=False)
+            self.mission_updates = []
+
+    async def import_steps(self):
+        locations = {}
+        location_names = list({child["location"] for child in self.children if child["location"]})
+        if location_names:
+            found = await Location.find(In(Location.name, location_names)).to_list()
+            locations = {location.name: location.id for location in found}
+
+        new_steps: Dict[PydanticObjectId, List[dict]] = defaultdict(list)
+        updates: List[UpdateOne] = []
+        moved: List[PydanticObjectId] = []
+        for child in self.children:
+            key = child["key"]
+            parent = self.missions.get(child["parent"])
+            if not parent:
+                self.error(key, f"Unknown parent event {child['parent']}")
+                continue
+            if parent["status"] in (MissionStatus.COMPLETED.value, MissionStatus.CANCELLED.value):
+                self.error(key, "Mission is not active")
+                continue
+
+            location = locations.get(child["location"])
+            digest = event_hash(child["name"], child["start"], child["end"], location, child["parent"])
+            try:
+                CreateStepSchema(
+                    order=0, name=child["name"], mission_id=parent["_id"],
+                    planned_start=child["start"], planned_end=child["end"], location=location,
+                )
+            except ValidationError as e:
+                self.error(key, str(e))
+                continue
+
+            existing = self.steps.get(key)
+            if existing and existing["mission_id"] == parent["_id"]:
+                if existing["hash"] == digest:
+                    self.report["steps"]["unchanged"] += 1
+                else:
+                    updates.append(UpdateOne({"_id": existing["_id"]}, {"$set": {
+                        "name": child["name"], "planned_start": child["start"], "planned_end": child["end"],
+                        "location": location, "calendar.hash": digest,
+                    }}))
+                    self.report["steps"]["updated"] += 1
+                continue
+            if existing:
+                # Re-parented in the calendar: recreate it under the new mission.
+                moved.append(existing["_id"])
+            child.update(mission_id=parent["_id"], location_id=location, hash=digest)
+            new_steps[parent["_id"]].append(child)
+
+        steps = Step.get_pymongo_collection()
+        if moved:
+            await steps.delete_many({"_id": {"$in": moved}})
+        for start in range(0, len(updates), self.batch_size):
+            await steps.bulk_write(updates[start:start + self.batch_size], ordered=False)
+        if not new_steps:
+            return
+
+        last_order = {
+            doc["_id"]: doc["order"]
+            async for doc in await steps.aggregate([
+                {"$match": {"mission_id": {"$in": list(new_steps)}}},
+                {"$group": {"_id": "$mission_id", "order": {"$max": "$order"}}},
+            ])
+        }
+        batch: List[Step] = []
+        for mission_id, children in new_steps.items():
+            children.sort(key=lambda child: child["start"] or datetime.max)
+            for order, child in enumerate(children, start=last_order.get(mission_id, 0) + 1):
+                batch.append(Step(
+                    order=order,
+                    name=child["name"],
+                    mission_id=mission_id,
+                    planned_start=child["start"],
+                    planned_end=child["end"],
+                    location=child["location_id"],
+                    status=StepStatus.PLANNED,
+                    calendar=CalendarSource(feed=self.feed, uid=child["key"], hash=child["hash"]),
+                ))
+                if len(batch) >= self.batch_size:
+                    await Step.insert_many(batch)
+                    batch = []
+        if batch:
+            await Step.insert_many(batch)
+        self.report["steps"]["created"] += sum(len(children) for children in new_steps.values())
+
+    async def prune(self):
+        """
+        Delete planned missions and steps whose events left the calendar.
+        """
+        stale_missions = [
+            mission["_id"] for key, mission in self.missions.items()
+            if key in self.existing_missions and key not in self.seen
+            and mission["status"] == MissionStatus.PLANNED.value
+        ]
+        stale_steps = [
+            step["_id"] for key, step in self.steps.items()
+            if key not in self.seen and step["status"] == StepStatus.PLANNED.value
+            and step["mission_id"] not in stale_missions
+        ]
+        if stale_missions:
+            await Step.get_pymongo_collection().delete_many({"mission_id": {"$in": stale_missions}})
+            result = await Mission.get_pymongo_collection().delete_many({"_id": {"$in": stale_missions}})
+            self.report["missions"]["deleted"] = result.deleted_count
+        if stale_steps:
+            result = await Step.get_pymongo_collection().delete_many({"_id": {"$in": stale_steps}})
+            self.report["steps"]["deleted"] = result.deleted_count
+
+    async def finish(self, prune: bool = False):
+        await self.flush_missions()
+        await self.import_steps()
+        if prune:
+            await self.prune()
+
+
+@calendar_router.post("/import/ics", dependencies=[Depends(FastJWT().login_required)])
+async def import_ics(
+    request: Request,
+    file: Annotated[UploadFile, File()],
+    calendar: Annotated[Optional[str], Form(description="Feed name, defaults to the file name")] = None,
+    prune: Annotated[bool, Form(description="Delete planned missions/steps no longer in the feed")] = False,
+):
+    """
+    Import an .ics file as missions (top-level events) and steps (events with
+    a RELATED-TO parent). Re-importing the same feed applies only the changes.
+    """
+    user: User = request.state.user
+    feed = calendar or file.filename or "calendar"
+
+    calendar_import = CalendarImport(user.id, feed)
+    await calendar_import.load()
+    try:
+        async for event in iter_events(file, on_error=lambda e: calendar_import.error(None, str(e))):
+            await calendar_import.add(event)
+        await calendar_import.finish(prune)
+    finally:
+        mission_changed(user.id)
+
+    return {"calendar": feed, **calendar_import.report}
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _mission_event(mission: dict, stamp: str) -> str:
+    calendar = mission.get("calendar") or {}
+    lines = [
+        "BEGIN:VEVENT\r\n",
+        content_line("UID", escape(calendar.get("uid") or f"mission-{mission['_id']}@sentinel")),
+        content_line("DTSTAMP", stamp),
+        content_line("DTSTART", format_datetime(mission["start_time"])),
+    ]
+    if mission.get("end_time"):
+        lines.append(content_line("DTEND", format_datetime(mission["end_time"])))
+    lines.append(content_line("SUMMARY", escape(mission["name"])))
+    if mission.get("summary"):
+        lines.append(content_line("DESCRIPTION", escape(mission["summary"])))
+    status = "CANCELLED" if mission["status"] == MissionStatus.CANCELLED.value else "CONFIRMED"
+    lines += [content_line("STATUS", status), "END:VEVENT\r\n"]
+    return "".join(lines)
+
+
+def _step_event(step: dict, mission_uid: str, stamp: str) -> str:
+    calendar = step.get("calendar") or {}
+    lines = [
+        "BEGIN:VEVENT\r\n",
+        content_line("UID", escape(calendar.get("uid") or f"step-{step['_id']}@sentinel")),
+        content_line("DTSTAMP", stamp),
+        content_line("DTSTART", format_datetime(step["planned_start"])),
+    ]
+    if step.get("planned_end"):
+        lines.append(content_line("DTEND", format_datetime(step["planned_end"])))
+    lines += [
+        content_line("SUMMARY", escape(step["name"])),
+        content_line("RELATED-TO", escape(mission_uid)),
+        "END:VEVENT\r\n",
+    ]
+    return "".join(lines)
+
+
+async def _feed(operator: PydanticObjectId, stamp: str) -> AsyncIterator[str]:
+    """
+    The operator's missions and steps as VEVENTs, in batches of missions with
+    one $in query for their steps each. Undated missions and steps are left out.
+    """
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Sentinel//Missions//EN\r\nCALSCALE:GREGORIAN\r\n"
+
+    missions = Mission.get_pymongo_collection().find(
+        {"operator": operator},
+        {"name": 1, "status": 1, "start_time": 1, "end_time": 1, "summary": 1, "calendar": 1},
+    ).sort("_id", 1).batch_size(FEED_BATCH_SIZE)
+    steps = Step.get_pymongo_collection()
+
+    batch: List[dict] = []
+    async for mission in missions:
+        batch.append(mission)
+        if len(batch) < FEED_BATCH_SIZE:
+            continue
+        yield await _feed_batch(batch, steps, stamp)
+        batch = []
+    if batch:
+        yield await _feed_batch(batch, steps, stamp)
+
+    yield "END:VCALENDAR\r\n"
+
+
+async def _feed_batch(missions: List[dict], steps, stamp: str) -> str:
+    uids = {
+        mission["_id"]: (mission.get("calendar") or {}).get("uid") or f"mission-{mission['_id']}@sentinel"
+        for mission in missions
+    }
+    chunks = [_mission_event(mission, stamp) for mission in missions if mission.get("start_time")]
+    cursor = steps.find(
+        {"mission_id": {"$in": list(uids)}, "planned_start": {"$ne": None}},
+        {"name": 1, "mission_id": 1, "planned_start": 1, "planned_end": 1, "calendar": 1},
+    ).sort([("mission_id", 1), ("order", 1)])
+    async for step in cursor:
+        chunks.append(_step_event(step, uids[step["mission_id"]], stamp))
+    return "".join(chunks)
+
+
+@calendar_router.post("/calendar.ics/token", dependencies=[Depends(FastJWT().login_required)])
+async def calendar_feed_token(request: Request):
+    """
+    Subscription URL of the user's calendar feed, authenticated by a token in
+    the query: calendar apps cannot send an Authorization header. The token
+    only opens the feed.
+    """
+    user: User = request.state.user
+    token, expire = await FastJWT().encode_scoped(user, "calendar", config.CALENDAR_TOKEN_TTL)
+    return {
+        "token": token,
+        "expire": expire,
+        "url": f"{config.API_BASE_URL}/api/private/mission/calendar.ics?token={token}",
+    }
+
+
+@calendar_router.get("/calendar.ics", dependencies=[Depends(FastJWT().calendar_login_required)])
+async def calendar_feed(request: Request):
+    """
+    iCalendar feed of the user's missions and of their planned steps (linked
+    to the mission with RELATED-TO). Supports If-None-Match / If-Modified-Since.
+    Accepts a token from POST /calendar.ics/token as `?token=`.
+    """
+    user: User = request.state.user
+
+    etag, last_modified = await feed_version(user.id)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if _not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+
+    stamp = format_datetime(last_modified.replace(tzinfo=None))
+    return StreamingResponse(
+        _feed(user.id, stamp),
+        media_type="text/calendar; charset=utf-8",
+        headers={**headers, "Content-Disposition": 'inline; filename="missions.ics"'},
+    )
@@ -1,43 +1,114 @@
+from datetime import datetime
+from typing import Optional
+from app.core.cache import TTLCache
+from app.core.config import config
+from app.core.events import MissionChange, on_mission_change
 from app.core.jwt import DecodedToken, FastJWT
-from models.models import Mission, Step, User
-from app.core.password_utils import get_password_hash, verify_password
+from models.models import Mission, MissionStatus, Step, StepStatus, User
 from beanie import PydanticObjectId
 from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel, Field
 
 
 dashboard_router = APIRouter(prefix="/dashboard")
 
+# Per-user aggregation results. Entries are dropped on every mission/step
+# write of that user, the TTL only bounds staleness from other workers.
+dashboard_cache: TTLCache[list] = TTLCache(ttl=config.DASHBOARD_CACHE_TTL)
+
+
+@on_mission_change
+def invalidate_dashboard(change: MissionChange):
+    dashboard_cache.invalidate(change.operator_id)
+
+
+def active_missions_pipeline(operator_id: PydanticObjectId) -> list:
+    """
+    Active missions of an operator joined to their active step and step progress.
+    """
+    return [
+        {"$match": {"operator": operator_id, "status": MissionStatus.ACTIVE.value}},
+        {"$lookup": {
+            "from": Step.get_collection_name(),
+            "localField": "_id",
+            "foreignField": "mission_id",
+            "pipeline": [
+                {"$match": {"status": StepStatus.ACTIVE.value}},
+                {"$sort": {"order": 1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "name": 1, "order": 1}},
+            ],
+            "as": "active_steps",
+        }},
+        {"$lookup": {
+            "from": Step.get_collection_name(),
+            "localField": "_id",
+            "foreignField": "mission_id",
+            "pipeline": [
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "done": {"$sum": {"$cond": [
+                        {"$in": ["$status", [StepStatus.DONE.value, StepStatus.SKIPPED.value]]}, 1, 0
+                    ]}},
+                    "planned_start": {"$min": "$planned_start"},
+                    "planned_end": {"$max": "$planned_end"},
+                }},
+            ],
+            "as": "progress",
+        }},
+        {"$project": {
+            "name": 1,
+            "status": 1,
+            "start_time": 1,
+            "end_time": 1,
+            "active_steps": 1,
+            "progress": {"$first": "$progress"},
+        }},
+    ]
+
+
+def _seconds_between(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    if not start or not end:
+        return None
+    return (end - start).total_seconds()
+
+
+def _mission_summary(mission: dict, now: datetime) -> dict:
+    progress = mission.get("progress") or {}
+    start_time = mission.get("start_time")
+    return {
+        "id": str(mission["_id"]),
+        "name": mission["name"],
+        "status": mission["status"],
+        "steps": mission["active_steps"],
+        "progress": {
+            "done_steps": progress.get("done", 0),
+            "total_steps": progress.get("total", 0),
+            "elapsed_seconds": _seconds_between(start_time, now),
+            "planned_seconds": _seconds_between(
+                progress.get("planned_start") or start_time,
+                progress.get("planned_end") or mission.get("end_time"),
+            ),
+        },
+    }
+
 
 @dashboard_router.get("/")
 async def dashboard_event(request: Request):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
-    
-    missions = []
-    active_missions = await Mission.find(Mission.operator == user.id, Mission.status == "active").to_list()
-    for mission in active_missions:
-        _mission = {
-            "id": str(mission.id),
-            "name": mission.name,
-            "status": mission.status,
-            "steps": []
-        }
-        step = await Step.find_one(Step.mission_id == mission.id, Step.status == "active")
-        if step:
-            _mission["steps"].append({
-                "name": step.name,
-                "order": step.order,
-            })
-        missions.append(_mission)
+    user: User = request.state.user
+
+    missions = dashboard_cache.get(user.id)
+    if missions is None:
+        missions = await Mission.aggregate(active_missions_pipeline(user.id)).to_list()
+        dashboard_cache.set(user.id, missions)
 
+    # Elapsed time is computed per request so cached entries never report stale progress.
+    now = datetime.utcnow()
     return {
         "message": "Dashboard endpoint",
         "user": {
             "name": user.username,
             "id": str(user.id)
         },
-        "active_missions": missions
-    }
\ No newline at end of file
+        "active_missions": [_mission_summary(mission, now) for mission in missions]
+    }
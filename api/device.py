@@ -0,0 +1,103 @@
+import secrets
+from typing import Optional
+from api.traccar import DEVICE_KEY_PARAM, device_cache, forward_key_cache, hash_device_secret
+from app.core.config import config
+from app.core.geofences import geofences
+from app.core.jwt import fresh_user
+from models.models import Device, User
+from beanie import PydanticObjectId
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+
+class CreateDeviceSchema(BaseModel):
+    # Device identifier configured in Traccar / Traccar Client.
+    unique_id: str
+    name: Optional[str] = None
+
+
+device_router = APIRouter(prefix="/device")
+
+
+def device_response(device: Device, secret: Optional[str] = None) -> dict:
+    response = device.model_dump(exclude={"secret_hash"})
+    response["authenticated"] = device.secret_hash is not None
+    if secret:
+        # Shown once; only its hash is stored.
+        response["secret"] = secret
+        response["key_param"] = f"{DEVICE_KEY_PARAM}={secret}"
+    return response
+
+
+async def get_own_device(device_id: PydanticObjectId, user: User) -> Device:
+    device = await Device.get(device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    if device.operator != user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return device
+
+
+@device_router.get("/")
+async def list_devices(request: Request):
+    user: User = request.state.user
+    return [device_response(device) for device in await Device.find(Device.operator == user.id).to_list()]
+
+
+@device_router.post("/")
+async def create_device(request: Request, payload: CreateDeviceSchema):
+    user: User = request.state.user
+
+    secret = secrets.token_urlsafe(24)
+    device = Device(**payload.model_dump(), operator=user.id, secret_hash=hash_device_secret(secret))
+    try:
+        await device.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Device already registered")
+    device_cache.invalidate(device.unique_id)
+    return device_response(device, secret)
+
+
+@device_router.post("/forward_secret")
+async def rotate_forward_secret(request: Request):
+    """
+    Issue the key of the user's Traccar server forwarding, accepted for all of
+    their devices on /traccar/forward. The previous key stops working.
+    """
+    user = await fresh_user(request)
+
+    secret = secrets.token_urlsafe(24)
+    await user.set({User.forward_secret_hash: hash_device_secret(secret)})
+    forward_key_cache.invalidate(user.id)
+    return {
+        "secret": secret,
+        "url": f"{config.API_BASE_URL}/api/public/traccar/forward?{DEVICE_KEY_PARAM}={secret}",
+    }
+
+
+@device_router.post("/{device_id}/secret")
+async def rotate_device_secret(device_id: PydanticObjectId, request: Request):
+    """
+    Issue a new device key, e.g. for devices registered before keys existed.
+    The previous key stops working.
+    """
+    user: User = request.state.user
+    device = await get_own_device(device_id, user)
+
+    secret = secrets.token_urlsafe(24)
+    await device.set({Device.secret_hash: hash_device_secret(secret)})
+    device_cache.invalidate(device.unique_id)
+    return device_response(device, secret)
+
+
+@device_router.delete("/{device_id}")
+async def delete_device(device_id: PydanticObjectId, request: Request):
+    user: User = request.state.user
+    device = await get_own_device(device_id, user)
+
+    await device.delete()
+    device_cache.invalidate(device.unique_id)
+    geofences.invalidate(device.operator)
+    return {"message": "Device deleted"}
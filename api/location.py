@@ -1,23 +1,97 @@
-from typing import Annotated, Optional
+from typing import Annotated, Optional, Tuple
 from app.core.jwt import DecodedToken, FastJWT
-from models.models import GeoPoint, Location, LocationType
+from app.core.pagination import PageParams, paginate, projection_model
+from models.models import GeoJSONPoint, Location, LocationType
 from datetime import datetime
 from beanie import PydanticObjectId
-from fastapi import APIRouter, HTTPException, Query, Request
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
 
 
 class CreateLocationSchema(BaseModel):
     name: str
     location_type: Optional[LocationType] = LocationType.GENERIC
-    coordinates: GeoPoint
+    coordinates: GeoJSONPoint
+    radius: float = Field(default=50.0, gt=0, le=5000)
 
 location_router = APIRouter(prefix="/location")
 
+# Upper bound of the `near` radius, in meters.
+MAX_NEAR_DISTANCE = 50_000
+# Widest viewport accepted by `bbox`, in degrees of longitude and latitude.
+MAX_BBOX_SPAN = 90.0
+
+
+def _floats(value: str, count: int, name: str) -> Tuple[float, ...]:
+    try:
+        numbers = tuple(float(part) for part in value.split(","))
+    except ValueError:
+        numbers = ()
+    if len(numbers) != count:
+        raise HTTPException(400, f"Invalid {name}")
+    return numbers
+
+
+def bbox_polygon(bbox: Tuple[float, float, float, float]) -> dict:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat],
+        ]],
+    }
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    min_lon, min_lat, max_lon, max_lat = _floats(value, 4, "bbox")
+    if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise HTTPException(400, "Invalid bbox, expected min_lon,min_lat,max_lon,max_lat")
+    if max_lon - min_lon > MAX_BBOX_SPAN or max_lat - min_lat > MAX_BBOX_SPAN:
+        raise HTTPException(400, f"bbox is wider than {MAX_BBOX_SPAN:g} degrees")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_near(value: str) -> GeoJSONPoint:
+    lat, lon = _floats(value, 2, "near")
+    try:
+        return GeoJSONPoint(coordinates=(lon, lat))
+    except ValueError:
+        raise HTTPException(400, "Invalid near, expected lat,lon")
+
 
 @location_router.get("/")
-async def list_locations():
-    locations =  await Location.find_all().to_list()
+async def list_locations(
+    response: Response,
+    page: Annotated[PageParams, Depends()],
+    near: Annotated[Optional[str], Query(description="lat,lon; nearest locations first")] = None,
+    max_distance: Annotated[float, Query(gt=0, le=MAX_NEAR_DISTANCE, description="near radius in meters")] = 5000,
+    bbox: Annotated[Optional[str], Query(description="min_lon,min_lat,max_lon,max_lat")] = None,
+):
+    """
+    Locations, newest first. `bbox` restricts them to a map viewport; `near`
+    returns up to `limit` locations within `max_distance`, nearest first.
+    """
+    if near and bbox:
+        raise HTTPException(400, "Use either near or bbox")
+
+    if near:
+        if page.cursor:
+            raise HTTPException(400, "cursor is not supported with near, raise limit or max_distance")
+        point = parse_near(near)
+        query = Location.find({"coordinates": {"$near": {
+            "$geometry": point.model_dump(),
+            "$maxDistance": max_distance,
+        }}}).limit(page.limit)
+        projection = projection_model(Location, page.fields)
+        if projection is not None:
+            query = query.project(projection)
+        return await query.to_list()
+
+    query = Location.find_all()
+    if bbox:
+        query = Location.find({"coordinates": {"$geoWithin": {"$geometry": bbox_polygon(parse_bbox(bbox))}}})
+    locations = await paginate(query, page, response)
     return locations
 
 
@@ -29,7 +103,10 @@ async def create_location(payload: CreateLocationSchema):
        raise HTTPException(status_code=400, detail="Location already exists")
     
     location = Location(**payload.model_dump())
-    await location.insert()
+    try:
+        await location.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Location already exists")
     return location
 
 
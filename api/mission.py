@@ -1,11 +1,18 @@
 import re
-from typing import Annotated, Optional
+from typing import Annotated, Dict, Iterable, Optional
+from app.core.database import transaction
+from app.core.events import mission_changed, mission_completed
 from app.core.jwt import DecodedToken, FastJWT
-from models.models import Location, MissionTemplate, Step, StepStatus, StepTemplate, User, Mission, MissionStatus
+from app.core.pagination import PageParams, paginate
+from app.core.predictions import predicted_offsets
+from models.models import Location, MissionTemplate, Step, StepStatus, StepTemplate, TemplateCounter, User, Mission, MissionStatus
 from datetime import datetime, timedelta
 from beanie import PydanticObjectId
-from fastapi import APIRouter, HTTPException, Query, Request
+from beanie.operators import In
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 class CreateMissionSchema(BaseModel):
     name: str
@@ -22,22 +29,81 @@ async def get_user_by_id(user_id: PydanticObjectId) -> Optional[User]:
     user: Optional[User] = await User.get(user_id)
     return user
 
+
+async def get_locations_by_ids(
+    location_ids: Iterable[Optional[PydanticObjectId]],
+) -> Dict[PydanticObjectId, Location]:
+    """Fetches every referenced location with a single $in query, keyed by id."""
+    ids = list({location_id for location_id in location_ids if location_id})
+    if not ids:
+        return {}
+    locations = await Location.find(In(Location.id, ids)).to_list()
+    return {location.id: location for location in locations}
+
+
+async def _legacy_template_number(operator: PydanticObjectId, template_name: str) -> int:
+    """
+    Next suffix after the operator's missions named before template counters existed.
+    """
+    existing_missions = await Mission.find(
+        {"operator": operator, "name": {"$regex": rf"^{re.escape(template_name)}(-\d+)?$"}}
+    ).to_list()
+
+    numbers = []
+    for m in existing_missions:
+        match = re.match(rf"^{re.escape(template_name)}-(\d+)$", m.name)
+        if match:
+            numbers.append(int(match.group(1)))
+        elif m.name == template_name:
+            numbers.append(0)  # exact match counts as first duplicate
+
+    return max(numbers, default=-1) + 1
+
+
+async def next_template_number(operator: PydanticObjectId, mission_template: MissionTemplate) -> int:
+    """
+    Atomically advance the operator's counter for a template name.
+
+    Returns the instance number: 0 for the first instance (named after the
+    template), n for the following ones (named "<template>-n").
+    """
+    collection = TemplateCounter.get_pymongo_collection()
+    key = {"operator": operator, "template_name": mission_template.name}
+    counter = await collection.find_one_and_update(
+        key, {"$inc": {"sequence": 1}}, return_document=ReturnDocument.AFTER
+    )
+    if counter is not None:
+        return counter["sequence"] - 1
+
+    # New counter: continue after the operator's missions already named after
+    # the template. Seeded in the upsert itself, so concurrent first requests
+    # each get their own number.
+    legacy_number = await _legacy_template_number(operator, mission_template.name)
+    seed = [{"$set": {"sequence": {"$add": [{"$max": [{"$ifNull": ["$sequence", 0]}, legacy_number]}, 1]}}}]
+    try:
+        counter = await collection.find_one_and_update(
+            key, seed, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent request created the counter first.
+        counter = await collection.find_one_and_update(key, seed, return_document=ReturnDocument.AFTER)
+    return counter["sequence"] - 1
+
+
 @mission_router.get("/")
 async def get_missions(
     request: Request,
+    response: Response,
+    page: Annotated[PageParams, Depends()],
     status_filter: Annotated[Optional[MissionStatus], Query(alias="mission_status")] = None,
 ):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        print(token, user)
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
 
-    filters = [Mission.operator == token.id]
+    filters = [Mission.operator == user.id]
     if status_filter is not None:
         filters.append(Mission.status == status_filter)
 
-    return await Mission.find(*filters).to_list()
+    return await paginate(Mission.find(*filters), page, response)
 
 @mission_router.get("/{mission_id}")
 async def get_mission(
@@ -46,27 +112,25 @@ async def get_mission(
     include_steps: Annotated[Optional[bool], Query(alias="include_steps")] = False,
     include_locations: Annotated[Optional[bool], Query(alias="include_locations")] = False,
 ):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
 
     mission = await Mission.get(mission_id)
     if not mission:
         raise HTTPException(404, "Mission not found")
 
-    if mission.operator != token.id:
+    if mission.operator != user.id:
         raise HTTPException(403, "Forbidden")
 
     steps_data = []
     if include_steps:
         steps = await Step.find(Step.mission_id == mission.id).to_list()
         if include_locations:
+            locations = await get_locations_by_ids(step.location for step in steps)
             steps_data = [
                 {
                     "_id": str(step.id),
                     **step.model_dump(exclude={"mission_id", "id"}),
-                    "location": await Location.get(step.location) if step.location else None,
+                    "location": locations.get(step.location) if step.location else None,
                 }
                 for step in steps
             ]
@@ -81,22 +145,19 @@ async def get_mission(
 
 @mission_router.post("/")
 async def new_mission(request: Request, payload: CreateMissionSchema):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user: Optional[User] = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
     
     if await Mission.find_one({
         "name": payload.name,
-        "operator": token.id
+        "operator": user.id
     }):
         raise HTTPException(400, "Mission Alredy Exists")
 
     mission = await Mission(
         **payload.model_dump(),
-        operator=token.id
+        operator=user.id
     ).insert()
-
+    mission_changed(user.id, mission.id)
 
     return mission
 
@@ -107,20 +168,20 @@ async def change_mission_state(
     request: Request,
     new_state: Annotated[MissionStatus, Query(alias="new_state")]
 ):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
 
     mission = await Mission.get(mission_id)
     if not mission:
         raise HTTPException(404, "Mission not found")
 
-    if mission.operator != token.id:
+    if mission.operator != user.id:
         raise HTTPException(403, "Forbidden")
 
     mission.status = new_state
     await mission.save()
+    mission_changed(mission.operator, mission.id, event="mission.status", data={"mission": mission})
+    if new_state == MissionStatus.COMPLETED:
+        mission_completed(mission.id)
 
     return mission
 
@@ -128,33 +189,44 @@ async def change_mission_state(
 # make mission template from mission id, copy all steps into step templates
 @mission_router.post("/{mission_id}/template")
 async def create_mission_template(mission_id: PydanticObjectId, request: Request):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
 
     mission = await Mission.get(mission_id)
     if not mission:
         raise HTTPException(404, "Mission not found")
 
-    if mission.operator != token.id:
+    if mission.operator != user.id:
         raise HTTPException(403, "Forbidden")
 
-    mission_template = await MissionTemplate(
+    mission_template = MissionTemplate(
+        id=PydanticObjectId(),
         name=mission.name,
         tags=mission.tags
-    ).insert()
+    )
 
     steps = await Step.find(Step.mission_id == mission.id).to_list()
-    step_templates = []
-    for step in steps:
-        step_template = await StepTemplate(
+    step_templates = [
+        StepTemplate(
             **step.model_dump(exclude={"id", "mission_id", "actual_start", "actual_end", "status"}),
+            id=PydanticObjectId(),
             mission_template=mission_template.id,
             start_time_offset=step.planned_start.timestamp() - mission.start_time.timestamp() if step.planned_start and mission.start_time else None,
             end_time_offset=step.planned_end.timestamp() - mission.start_time.timestamp() if step.planned_end and mission.start_time else None
-        ).insert()
-        step_templates.append(step_template)
+        )
+        for step in steps
+    ]
+
+    async with transaction() as session:
+        try:
+            await mission_template.insert(session=session)
+            if step_templates:
+                await StepTemplate.insert_many(step_templates, session=session)
+        except Exception:
+            if session is None:
+                # No transaction to roll back on a standalone server.
+                await StepTemplate.find(StepTemplate.mission_template == mission_template.id).delete()
+                await MissionTemplate.find(MissionTemplate.id == mission_template.id).delete()
+            raise
 
     return {
         "mission_template": mission_template,
@@ -168,62 +240,83 @@ async def create_mission_from_template(
     request: Request,
     fast_start: Annotated[bool, Query(alias="fast_start")] = False
 ):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
 
     mission_template = await MissionTemplate.get(mission_template_id)
     if not mission_template:
         raise HTTPException(404, "Mission template not found")
 
-    # Get all missions starting with template name
-    existing_missions = await Mission.find(
-        {"name": {"$regex": f"^{re.escape(mission_template.name)}"}}
-    ).to_list()
-
-    # Collect numeric suffixes
-    numbers = []
-    for m in existing_missions:
-        match = re.match(rf"^{re.escape(mission_template.name)}-(\d+)$", m.name)
-        if match:
-            numbers.append(int(match.group(1)))
-        elif m.name == mission_template.name:
-            numbers.append(0)  # exact match counts as first duplicate
-
-    next_number = max(numbers, default=-1) + 1
+    next_number = await next_template_number(user.id, mission_template)
 
     # Assign new name
     mission_name = mission_template.name if next_number == 0 else f"{mission_template.name}-{next_number}"
 
     # Create the mission
-    mission = await Mission(
+    mission = Mission(
         **mission_template.model_dump(exclude={"id", "name"}),
+        id=PydanticObjectId(),
         name=mission_name,
         operator=user.id,
+        mission_template=mission_template.id,
+        sequence=next_number,
         start_time=datetime.utcnow() if fast_start else None,
         status=MissionStatus.ACTIVE if fast_start else MissionStatus.PLANNED
-    ).insert()
+    )
 
-    # Copy steps preserving order
+    # Copy steps preserving order, planned from the template's learned durations
     step_templates = await StepTemplate.find(StepTemplate.mission_template == mission_template.id).sort(StepTemplate.order).to_list()
+    steps = []
     for step_template in step_templates:
-        await Step(
-            **step_template.model_dump(exclude={"id", "mission_template"}),
+        start_offset, end_offset = predicted_offsets(step_template)
+        active = fast_start and step_template.order == 1
+        steps.append(Step(
+            **step_template.model_dump(exclude={"id", "mission_template", "start_offset_stats", "duration_stats"}),
+            id=PydanticObjectId(),
             mission_id=mission.id,
-            planned_start=mission.start_time + timedelta(seconds=step_template.start_time_offset) if mission.start_time and step_template.start_time_offset is not None else None,
-            status=StepStatus.ACTIVE if fast_start and step_template.order == 1 else StepStatus.PLANNED
-        ).insert()
+            step_template=step_template.id,
+            planned_start=mission.start_time + timedelta(seconds=start_offset) if mission.start_time and start_offset is not None else None,
+            planned_end=mission.start_time + timedelta(seconds=end_offset) if mission.start_time and end_offset is not None else None,
+            actual_start=mission.start_time if active else None,
+            status=StepStatus.ACTIVE if active else StepStatus.PLANNED
+        ))
+
+    # One round trip for all steps; a failure never leaves a half-copied mission.
+    async with transaction() as session:
+        try:
+            await mission.insert(session=session)
+            if steps:
+                await Step.insert_many(steps, session=session)
+        except Exception:
+            if session is None:
+                # No transaction to roll back on a standalone server.
+                await Step.find(Step.mission_id == mission.id).delete()
+                await Mission.find(Mission.id == mission.id).delete()
+            raise
+    mission_changed(mission.operator, mission.id)
 
     return mission
 
 
 @mission_router.get("/templates/")
 async def list_mission_templates(
+    response: Response,
+    page: Annotated[PageParams, Depends()],
     include_steps: Annotated[Optional[bool], Query(alias="include_steps")] = False,
     include_locations: Annotated[Optional[bool], Query(alias="include_locations")] = False
 ):
-    templates = await MissionTemplate.find_all().to_list()
+    templates = await paginate(MissionTemplate.find_all(), page, response)
+
+    step_templates_by_template: Dict[PydanticObjectId, list] = {template.id: [] for template in templates}
+    locations: Dict[PydanticObjectId, Location] = {}
+    if include_steps and templates:
+        step_templates = await StepTemplate.find(
+            In(StepTemplate.mission_template, list(step_templates_by_template))
+        ).sort(StepTemplate.order).to_list()
+        for step_template in step_templates:
+            step_templates_by_template[step_template.mission_template].append(step_template)
+        if include_locations:
+            locations = await get_locations_by_ids(step_template.location for step_template in step_templates)
+
     result = [] 
     for template in templates:
         template_data = {
@@ -231,13 +324,13 @@ async def list_mission_templates(
             "step_templates": []
         }
         if include_steps:
-            step_templates = await StepTemplate.find(StepTemplate.mission_template == template.id).sort(StepTemplate.order).to_list()
+            step_templates = step_templates_by_template[template.id]
             if include_locations:
                 template_data["step_templates"] = [
                     {
                         "_id": str(step_template.id),
                         **step_template.model_dump(exclude={"mission_template", "id"}),
-                        "location": await Location.get(step_template.location) if step_template.location else None,
+                        "location": locations.get(step_template.location) if step_template.location else None,
                     }
                     for step_template in step_templates
                 ]
@@ -0,0 +1,164 @@
+import re
+from typing import Annotated, List, Optional, Tuple
+from app.core.pagination import NEXT_CURSOR_HEADER, PageParams, paginate
+from models.models import Mission, Note, Step, User
+from beanie import PydanticObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+
+# Characters of context around the first match in a search snippet.
+SNIPPET_CONTEXT = 80
+
+
+class CreateNoteSchema(BaseModel):
+    mission_id: PydanticObjectId
+    step_id: Optional[PydanticObjectId] = None
+    content: str = Field(min_length=1, max_length=20000)
+
+
+note_router = APIRouter(prefix="/note")
+
+
+async def get_own_mission(mission_id: PydanticObjectId, user: User) -> Mission:
+    mission = await Mission.get(mission_id)
+    if not mission:
+        raise HTTPException(404, "Mission not found")
+
+    if mission.operator != user.id:
+        raise HTTPException(403, "Forbidden")
+    return mission
+
+
+def search_terms(query: str) -> List[str]:
+    """
+    Positive terms and phrases of a $text search string, lowercased.
+    """
+    phrases = re.findall(r'"([^"]+)"', query)
+    words = [word for word in re.sub(r'"[^"]*"', " ", query).split() if not word.startswith("-")]
+    return [term.lower() for term in phrases + words if term.strip()]
+
+
+def highlight(content: str, terms: List[str]) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Snippet of `content` around the first matched term, with the [start, end)
+    offsets of every match in it. Words match on a prefix of the term, to
+    approximate the stemming of the text index.
+    """
+    patterns = [
+        re.escape(term) if " " in term else r"\b" + re.escape(term[:max(len(term) - 3, 3)]) + r"\w*"
+        for term in terms
+    ]
+    if not patterns:
+        return content[:2 * SNIPPET_CONTEXT], []
+    matcher = re.compile("|".join(patterns), re.IGNORECASE)
+
+    first = matcher.search(content)
+    center = first.start() if first else 0
+    start = max(center - SNIPPET_CONTEXT, 0)
+    end = min(center + SNIPPET_CONTEXT, len(content))
+    snippet = content[start:end]
+    highlights = [match.span() for match in matcher.finditer(snippet)]
+
+    if start > 0:
+        snippet = "…" + snippet
+        highlights = [(a + 1, b + 1) for a, b in highlights]
+    if end < len(content):
+        snippet += "…"
+    return snippet, highlights
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, PydanticObjectId]:
+    try:
+        score, _, note_id = cursor.partition(":")
+        return float(score), PydanticObjectId(note_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+
+@note_router.post("/")
+async def create_note(request: Request, payload: CreateNoteSchema):
+    user: User = request.state.user
+    mission = await get_own_mission(payload.mission_id, user)
+
+    if payload.step_id:
+        step = await Step.get(payload.step_id)
+        if not step or step.mission_id != mission.id:
+            raise HTTPException(400, "Step does not belong to the mission")
+
+    note = Note(**payload.model_dump(), operator=user.id)
+    await note.insert()
+    return note
+
+
+@note_router.get("/")
+async def list_notes(
+    request: Request,
+    response: Response,
+    page: Annotated[PageParams, Depends()],
+    mission_id: PydanticObjectId,
+    step_id: Optional[PydanticObjectId] = None,
+):
+    user: User = request.state.user
+    mission = await get_own_mission(mission_id, user)
+
+    filters = [Note.mission_id == mission.id]
+    if step_id:
+        filters.append(Note.step_id == step_id)
+    return await paginate(Note.find(*filters), page, response)
+
+
+@note_router.get("/search")
+async def search_notes(
+    request: Request,
+    response: Response,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    page: Annotated[PageParams, Depends()],
+    mission_id: Optional[PydanticObjectId] = None,
+):
+    """
+    Full-text search over the user's notes, best matches first.
+
+    Each hit carries a snippet around the first match and the offsets of the
+    matched words in it. Pass the X-Next-Cursor header back as `cursor`.
+    """
+    user: User = request.state.user
+
+    match = {"$text": {"$search": q}, "operator": user.id}
+    if mission_id:
+        match["mission_id"] = mission_id
+
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if page.cursor:
+        score, note_id = decode_search_cursor(page.cursor)
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "_id": {"$lt": note_id}},
+        ]}})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": -1}},
+        {"$limit": page.limit + 1},
+    ]
+
+    cursor = await Note.get_pymongo_collection().aggregate(pipeline)
+    notes = await cursor.to_list()
+    if len(notes) > page.limit:
+        notes = notes[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = f"{notes[-1]['score']!r}:{notes[-1]['_id']}"
+
+    terms = search_terms(q)
+    results = []
+    for note in notes:
+        snippet, highlights = highlight(note["content"], terms)
+        results.append({
+            "id": str(note["_id"]),
+            "mission_id": str(note["mission_id"]),
+            "step_id": str(note["step_id"]) if note.get("step_id") else None,
+            "created_at": note.get("created_at"),
+            "score": note["score"],
+            "snippet": snippet,
+            "highlights": highlights,
+        })
+    return results
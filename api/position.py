@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+from api.step import advance_mission
+from app.core.geofences import geofences
+from app.core.positions import position_buffer, tag_position
+from models.models import GeoPoint, Mission, MissionStatus, Position, PositionMeta, User
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field, field_validator
+
+logger = logging.getLogger(__name__)
+
+
+class PositionReportSchema(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+    timestamp: Optional[datetime] = None
+
+    accuracy: Optional[float] = None
+    speed: Optional[float] = None
+    bearing: Optional[float] = None
+    altitude: Optional[float] = None
+    battery: Optional[float] = None
+
+    device_id: str = "app"
+
+    @field_validator("timestamp")
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+position_router = APIRouter(prefix="/position")
+
+
+async def report_position(position: Position, trusted: bool = True) -> Optional[dict]:
+    """
+    Queue a fix for storage and apply the step transition it triggers, if any.
+    Untrusted fixes (legacy trackers without a key) are stored as they are:
+    not linked to a mission, they never reach routes, tracks or geofences.
+    """
+    if not trusted:
+        position_buffer.add(position)
+        return None
+
+    try:
+        await tag_position(position)
+    except Exception:
+        logger.exception("Failed to link a fix of operator %s to its mission", position.meta.operator)
+    position_buffer.add(position)
+
+    try:
+        triggered = await geofences.evaluate(position)
+    except Exception:
+        # The fix is already queued; a failed lookup must not make trackers resend it.
+        logger.exception("Geofence evaluation failed for operator %s", position.meta.operator)
+        return None
+    if not triggered:
+        return None
+    geofence, event = triggered
+
+    mission = await Mission.get(geofence.mission_id)
+    # Progressed since the geofence was loaded; the change reloads it.
+    if not mission or mission.status != MissionStatus.ACTIVE or mission.progress_version != geofence.progress_version:
+        return None
+
+    try:
+        mission, active_step = await advance_mission(mission)
+    except HTTPException as e:
+        logger.warning("Geofence %s on step %s not applied: %s", event.value, geofence.step_id, e.detail)
+        return None
+
+    return {
+        "event": event,
+        "step_id": geofence.step_id,
+        "mission": mission,
+        "active_step": active_step,
+    }
+
+
+@position_router.post("/")
+async def report(request: Request, payload: PositionReportSchema):
+    """
+    Position report from the operator's own app. Arriving at a movement step's
+    location, or leaving the location of any other step, advances the mission.
+    """
+    user: User = request.state.user
+
+    position = Position(
+        timestamp=payload.timestamp or datetime.utcnow(),
+        meta=PositionMeta(device_id=payload.device_id, operator=user.id),
+        coordinates=GeoPoint(lat=payload.lat, lon=payload.lon),
+        **payload.model_dump(include={"accuracy", "speed", "bearing", "altitude", "battery"}),
+    )
+    transition = await report_position(position)
+
+    return {"status": "ok", "transition": transition}
@@ -1,12 +1,13 @@
 from time import time
 from app.core.config import config
-from app.core.email import send_email
-from app.core.jwt import DecodedToken, FastJWT
+from app.core.email import enqueue_email
+from app.core.jwt import DecodedToken, FastJWT, fresh_user, invalidate_user_tokens
 from models.models import Mission, Step, User
 from app.core.password_utils import get_password_hash, verify_password
 from beanie import PydanticObjectId
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
 
 
 profile_router = APIRouter(prefix="/profile")
@@ -14,10 +15,7 @@ profile_router = APIRouter(prefix="/profile")
 
 @profile_router.get("/")
 async def profile_event(request: Request):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
     
     return {
         "id": str(user.id),
@@ -28,11 +26,8 @@ async def profile_event(request: Request):
     
 
 @profile_router.post("/set_email")
-async def set_email_event(request: Request, email: str, background_tasks: BackgroundTasks):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+async def set_email_event(request: Request, email: str):
+    user = await fresh_user(request)
     
     if await User.find_one(User.email == email):
         raise HTTPException(400, "Email already in use")
@@ -40,8 +35,12 @@ async def set_email_event(request: Request, email: str, background_tasks: Backgr
     if user.email:
         raise HTTPException(400, "Email already set, use change_email endpoint")
 
-    user.email = email
-    await user.save()
+    try:
+        await user.set({User.email: email})
+    except DuplicateKeyError:
+        raise HTTPException(400, "Email already in use")
+    finally:
+        invalidate_user_tokens(user.id)
 
     token = await FastJWT().encode({
         "id": str(user.id),
@@ -51,7 +50,7 @@ async def set_email_event(request: Request, email: str, background_tasks: Backgr
 
     verification_link = f"{config.API_BASE_URL}/verify?email={email}&token={token}"
 
-    background_tasks.add_task(send_email,
+    await enqueue_email(
         to=email,
         subject="Verify your email address for Sentinel",       
         body="Please click the link below to verify your email address:\n\n{verification_link} \n\nIf you did not request this email, please ignore it.".format(verification_link=verification_link),
@@ -61,11 +60,8 @@ async def set_email_event(request: Request, email: str, background_tasks: Backgr
 
 
 @profile_router.post("/resend_verification")
-async def resend_verification_event(request: Request, background_tasks: BackgroundTasks): 
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+async def resend_verification_event(request: Request): 
+    user = await fresh_user(request)
     
     if not user.email:
         raise HTTPException(400, "Email not set")
@@ -81,7 +77,7 @@ async def resend_verification_event(request: Request, background_tasks: Backgrou
 
     verification_link = f"{config.API_BASE_URL}/verify?email={user.email}&token={token}"
 
-    background_tasks.add_task(send_email,
+    await enqueue_email(
         to=user.email,
         subject="Verify your email address for Sentinel",       
         body="Please click the link below to verify your email address:\n\n{verification_link} \n\nIf you did not request this email, please ignore it.".format(verification_link=verification_link),
@@ -96,25 +92,23 @@ class ChangePasswordRequest(BaseModel):
     new_password: str = Field(..., min_length=6)
 
 @profile_router.post("/change_password")
-async def change_password_event(request: Request, body: ChangePasswordRequest, background_tasks: BackgroundTasks):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+async def change_password_event(request: Request, body: ChangePasswordRequest):
+    user = await fresh_user(request)
     
     if body.current_password == body.new_password:
         raise HTTPException(400, "New password must be different from current password")
 
-    if not verify_password(body.current_password, user.password):
+    if not await verify_password(body.current_password, user.password):
         raise HTTPException(400, "Current password is incorrect")
     
-    user.password = get_password_hash(body.new_password)
-    await user.save()
+    await user.set({User.password: await get_password_hash(body.new_password)})
+    invalidate_user_tokens(user.id)
 
-    background_tasks.add_task(send_email,
-        to=user.email,
-        subject="Password changed for Sentinel",
-        body="Your password has been changed successfully. If you did not perform this action, please contact support immediately.",
-    )
+    if user.email:
+        await enqueue_email(
+            to=user.email,
+            subject="Password changed for Sentinel",
+            body="Your password has been changed successfully. If you did not perform this action, please contact support immediately.",
+        )
 
     return {"message": "Password changed successfully"}
\ No newline at end of file
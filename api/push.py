@@ -0,0 +1,51 @@
+import asyncio
+import json
+from app.core.config import config
+from app.core.jwt import FastJWT
+from app.core.pubsub import broker
+from models.models import User
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+
+# Authenticated per route: the stream also accepts an events token in the query.
+push_router = APIRouter(prefix="/events")
+
+
+@push_router.post("/token", dependencies=[Depends(FastJWT().login_required)])
+async def events_token(request: Request):
+    """
+    Short-lived token for `GET /events/?token=`, for EventSource clients.
+    It only opens the stream; fetch a new one before reconnecting once it expired.
+    """
+    user: User = request.state.user
+    token, expire = await FastJWT().encode_scoped(user, "events", config.PUSH_TOKEN_TTL)
+    return {"token": token, "expire": expire}
+
+
+@push_router.get("/", dependencies=[Depends(FastJWT().events_login_required)])
+async def mission_events(request: Request):
+    """
+    Server-Sent Events stream of the user's mission and step changes:
+    `mission.progressed`, `mission.status`, `step.status`, `mission.changed`
+    (reload that mission) and `resync` (reload everything).
+    """
+    user: User = request.state.user
+
+    async def stream():
+        async with broker.subscribe(user.id) as queue:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=config.PUSH_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection.
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -3,12 +3,20 @@ from typing import Optional
 from beanie import PydanticObjectId
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
+from api.analytics import analytics_router
 from api.auth import auth_router
+from api.calendar import calendar_router
 from api.mission import mission_router
+from api.note import note_router
 from api.location import location_router
 from api.step import step_router
 from api.dashboard import dashboard_router
 from api.profile import profile_router
+from api.push import push_router
+from api.device import device_router
+from api.position import position_router
+from api.traccar import traccar_router
+from api.track import track_router
 from app.core.jwt import FastJWT
 
 
@@ -18,11 +26,21 @@ private_router = APIRouter(prefix="/private")
 
 
 public_router.include_router(auth_router)
+# Trackers cannot send a JWT; fixes are accepted for registered device ids only.
+public_router.include_router(traccar_router)
+# Before mission_router, whose /mission/{mission_id} would shadow the calendar paths.
+private_router.include_router(calendar_router)
 private_router.include_router(mission_router, dependencies=[Depends(FastJWT().login_required)])
 private_router.include_router(location_router, dependencies=[Depends(FastJWT().login_required)])
 private_router.include_router(step_router, dependencies=[Depends(FastJWT().login_required)])
 private_router.include_router(dashboard_router, dependencies=[Depends(FastJWT().login_required)])
 private_router.include_router(profile_router, dependencies=[Depends(FastJWT().login_required)])
+private_router.include_router(device_router, dependencies=[Depends(FastJWT().login_required)])
+private_router.include_router(track_router, dependencies=[Depends(FastJWT().login_required)])
+private_router.include_router(position_router, dependencies=[Depends(FastJWT().login_required)])
+private_router.include_router(analytics_router, dependencies=[Depends(FastJWT().login_required)])
+private_router.include_router(note_router, dependencies=[Depends(FastJWT().login_required)])
+private_router.include_router(push_router)
 
 router.include_router(public_router)
 router.include_router(private_router)
@@ -1,10 +1,16 @@
-from typing import Annotated, Optional
+from typing import Annotated, Optional, Tuple
+from app.core.database import transaction
+from app.core.events import mission_changed, mission_completed
 from app.core.jwt import DecodedToken, FastJWT
+from app.core.pagination import PageParams, paginate
+from app.core.predictions import record_step_actuals
 from models.models import Location, StepType, User, Mission, MissionStatus, Step, StepStatus
 from datetime import datetime
 from beanie import PydanticObjectId
-from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 
 class CreateStepSchema(BaseModel):
@@ -26,17 +32,14 @@ step_router = APIRouter(prefix="/step")
 
 
 @step_router.get("/")
-async def list_steps():
-    steps = await Step.find_all().to_list()
+async def list_steps(response: Response, page: Annotated[PageParams, Depends()]):
+    steps = await paginate(Step.find_all(), page, response)
     return steps
 
 
 @step_router.post("/")
 async def create_step(request: Request, payload: CreateStepSchema):
-    token: DecodedToken = await FastJWT().decode(request.headers["Authorization"])
-    user = await User.get(token.id)
-    if not user:
-        raise HTTPException(401, "Unauthorized")
+    user: User = request.state.user
     
     mission = await Mission.get(payload.mission_id)
     if not mission:
@@ -62,7 +65,11 @@ async def create_step(request: Request, payload: CreateStepSchema):
     step = Step(
         **payload.model_dump(),
     )
-    await step.insert()
+    try:
+        await step.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Step already exists")
+    mission_changed(mission.operator, mission.id)
     return step
 
 
@@ -75,54 +82,122 @@ async def get_step(step_id: PydanticObjectId):
 
 
 @step_router.patch("/{step_id}")
-async def change_step_status(step_id: PydanticObjectId, status: StepStatus):
+async def change_step_status(step_id: PydanticObjectId, status: StepStatus, request: Request):
+    user: User = request.state.user
     step = await Step.get(step_id)
     if not step:
         raise HTTPException(status_code=404, detail="Step not found")
 
+    mission = await Mission.get(step.mission_id)
+    if not mission:
+        raise HTTPException(status_code=404, detail="Mission not found")
+
+    if mission.operator != user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to change steps of this mission")
+
     step.status = status
     await step.save()
+    mission_changed(mission.operator, mission.id, event="step.status", data={"step": step})
     return step
 
 
+async def advance_mission(mission: Mission) -> Tuple[Mission, Optional[Step]]:
+    """
+    Close the active step of a mission and activate the next one in order,
+    completing the mission when no step is left.
+
+    The mission's progress_version is claimed with a conditional update first,
+    so of two requests that saw the same state only one advances the mission.
+    Only the two affected steps are touched; on replica sets all writes share
+    a transaction.
+    """
+    missions = Mission.get_pymongo_collection()
+    steps = Step.get_pymongo_collection()
+    now = datetime.utcnow()
+
+    claim = {"$inc": {"progress_version": 1}}
+    if mission.status == MissionStatus.PLANNED:
+        claim["$set"] = {"status": MissionStatus.ACTIVE.value, "start_time": now}
+
+    async with transaction() as session:
+        mission_doc = await missions.find_one_and_update(
+            {
+                "_id": mission.id,
+                "status": mission.status.value,
+                # Documents written before the field existed count as version 0.
+                "progress_version": mission.progress_version or {"$in": [0, None]},
+            },
+            claim,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if mission_doc is None:
+            raise HTTPException(status_code=409, detail="Mission was changed by another request, reload and retry")
+
+        closed_step = await steps.find_one_and_update(
+            {"mission_id": mission.id, "status": StepStatus.ACTIVE.value},
+            {"$set": {"status": StepStatus.DONE.value, "actual_end": now}},
+            sort=[("order", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if closed_step is not None:
+            await record_step_actuals(closed_step, mission_doc.get("start_time"), session=session)
+
+        next_filter = {
+            "mission_id": mission.id,
+            "status": {"$nin": [StepStatus.DONE.value, StepStatus.SKIPPED.value, StepStatus.ACTIVE.value]},
+        }
+        if closed_step:
+            next_filter["order"] = {"$gt": closed_step["order"]}
+        next_step = await steps.find_one_and_update(
+            next_filter,
+            {"$set": {"status": StepStatus.ACTIVE.value, "actual_start": now}},
+            sort=[("order", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+
+        if next_step is None:
+            if closed_step is None and not await steps.find_one({"mission_id": mission.id}, session=session):
+                raise HTTPException(status_code=400, detail="No steps in the mission")
+
+            mission_doc = await missions.find_one_and_update(
+                {"_id": mission.id},
+                {"$set": {"status": MissionStatus.COMPLETED.value, "end_time": now}},
+                return_document=ReturnDocument.AFTER,
+                session=session,
+            )
+
+    mission_changed(
+        mission.operator, mission.id,
+        event="mission.progressed", data={"mission": mission_doc, "active_step": next_step},
+    )
+    if mission_doc["status"] == MissionStatus.COMPLETED.value:
+        mission_completed(mission.id)
+
+    return (
+        Mission.model_validate(mission_doc),
+        Step.model_validate(next_step) if next_step else None,
+    )
+
+
 @step_router.post("/proceed/{mission_id}")
-async def proceed_mission_step(mission_id: PydanticObjectId):
+async def proceed_mission_step(mission_id: PydanticObjectId, request: Request):
+    user: User = request.state.user
     mission = await Mission.get(mission_id)
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
+
+    if mission.operator != user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
     
     if mission.status in [MissionStatus.COMPLETED, MissionStatus.CANCELLED]:
         raise HTTPException(status_code=400, detail="Mission is not active")
 
-    if mission.status == MissionStatus.PLANNED:
-        mission.status = MissionStatus.ACTIVE
-        mission.start_time = datetime.utcnow()
-        await mission.save()
-
-    steps = await Step.find(Step.mission_id == mission.id).sort(Step.order).to_list()
-    if not steps:
-        raise HTTPException(status_code=400, detail="No steps in the mission")
-
-    active_step = next((s for s in steps if s.status == StepStatus.ACTIVE), None)
-    if active_step:
-        active_step.status = StepStatus.DONE
-        active_step.actual_end = datetime.utcnow()
-        await active_step.save()
-        next_step_index = steps.index(active_step) + 1
-    else:
-        next_step_index = 0
-
-    if next_step_index < len(steps):
-        next_step = steps[next_step_index]
-        next_step.status = StepStatus.ACTIVE
-        next_step.actual_start = datetime.utcnow()
-        await next_step.save()
-    else:
-        mission.status = MissionStatus.COMPLETED
-        mission.end_time = datetime.utcnow()
-        await mission.save()
+    mission, active_step = await advance_mission(mission)
 
     return {
         "mission": mission,
-        "active_step": next_step if next_step_index < len(steps) else None
+        "active_step": active_step
     }
\ No newline at end of file
@@ -0,0 +1,207 @@
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from typing import Any, Optional
+from api.position import report_position
+from app.core.cache import TTLCache
+from app.core.config import config
+from beanie import PydanticObjectId
+from models.models import Device, GeoPoint, Position, PositionMeta, User
+from fastapi import APIRouter, HTTPException, Request
+
+# m/s -> knots, Traccar's unit for speed.
+KNOTS_PER_MPS = 1.943844
+
+traccar_router = APIRouter(prefix="/traccar")
+
+# Query parameter (or header) carrying the device key; Traccar Client and
+# Traccar's forward.url both accept it as part of the configured URL.
+DEVICE_KEY_PARAM = "key"
+DEVICE_KEY_HEADER = "X-Device-Key"
+
+# unique_id -> Device, or False for ids that are not registered.
+device_cache: TTLCache = TTLCache(ttl=config.DEVICE_CACHE_TTL, maxsize=10000)
+# operator -> hash of their forwarding key, or False when they have none.
+forward_key_cache: TTLCache = TTLCache(ttl=config.DEVICE_CACHE_TTL, maxsize=10000)
+
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _timestamp(value: Any) -> datetime:
+    """Unix seconds or milliseconds, or an ISO 8601 string; naive UTC like the rest of the app."""
+    if value in (None, ""):
+        return datetime.utcnow()
+    number = _float(value)
+    if number is not None:
+        if number > 1e11:
+            number /= 1000
+        try:
+            return datetime.fromtimestamp(number, tz=timezone.utc).replace(tzinfo=None)
+        except (OverflowError, OSError) as e:
+            raise ValueError(f"Timestamp out of range: {e}")
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+async def get_device(unique_id: str) -> Device:
+    device = device_cache.get(unique_id)
+    if device is None:
+        device = await Device.find_one(Device.unique_id == unique_id) or False
+        device_cache.set(unique_id, device)
+    if not device:
+        raise HTTPException(404, "Unknown device")
+    return device
+
+
+def hash_device_secret(secret: str) -> str:
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()
+
+
+def device_key(request: Request) -> Optional[str]:
+    return request.query_params.get(DEVICE_KEY_PARAM) or request.headers.get(DEVICE_KEY_HEADER)
+
+
+def key_matches(secret_hash: Optional[str], key: Optional[str]) -> bool:
+    return bool(secret_hash and key) and hmac.compare_digest(secret_hash, hash_device_secret(key))
+
+
+async def get_forward_key_hash(operator: PydanticObjectId) -> Optional[str]:
+    secret_hash = forward_key_cache.get(operator)
+    if secret_hash is None:
+        user = await User.get(operator)
+        secret_hash = (user.forward_secret_hash if user else None) or False
+        forward_key_cache.set(operator, secret_hash)
+    return secret_hash or None
+
+
+async def ingest(
+    unique_id: Optional[str],
+    latitude: Any,
+    longitude: Any,
+    timestamp: Any,
+    key: Optional[str] = None,
+    forwarded: bool = False,
+    **fields,
+) -> Position:
+    """
+    Validate one fix and queue it for the next batched write.
+
+    Device ids are easy to guess, so fixes must carry the device's key, or
+    for `forwarded` fixes the operator's forwarding key. Devices registered
+    before keys existed (and with no forwarding key set) are accepted
+    without one, but their fixes are only stored: they are not linked to
+    missions and do not advance them.
+    """
+    if not unique_id:
+        raise HTTPException(400, "Missing device id")
+    lat, lon = _float(latitude), _float(longitude)
+    if lat is None or lon is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise HTTPException(400, "Invalid coordinates")
+    try:
+        fix_time = _timestamp(timestamp)
+    except ValueError:
+        raise HTTPException(400, "Invalid timestamp")
+
+    device = await get_device(unique_id)
+    secret_hashes = [device.secret_hash]
+    if forwarded:
+        secret_hashes.append(await get_forward_key_hash(device.operator))
+    secret_hashes = [secret_hash for secret_hash in secret_hashes if secret_hash]
+    trusted = any(key_matches(secret_hash, key) for secret_hash in secret_hashes)
+    if secret_hashes and not trusted:
+        raise HTTPException(401, "Invalid device key")
+
+    position = Position(
+        timestamp=fix_time,
+        meta=PositionMeta(device_id=device.unique_id, operator=device.operator),
+        coordinates=GeoPoint(lat=lat, lon=lon),
+        **{name: _float(value) for name, value in fields.items()},
+    )
+    await report_position(position, trusted=trusted)
+    return position
+
+
+@traccar_router.api_route("/osmand", methods=["GET", "POST"])
+async def osmand_event(request: Request):
+    """
+    OsmAnd protocol as sent by Traccar Client: fix in the query string, or
+    (newer clients) a JSON body with `device_id` and a `location` object.
+    """
+    params = request.query_params
+    if params.get("lat") is not None or params.get("location") is not None:
+        lat, lon = params.get("lat"), params.get("lon")
+        if params.get("location"):
+            lat, _, lon = params["location"].partition(",")
+        await ingest(
+            params.get("id") or params.get("deviceid"),
+            lat,
+            lon,
+            params.get("timestamp"),
+            key=device_key(request),
+            speed=params.get("speed"),
+            bearing=params.get("bearing") or params.get("heading"),
+            altitude=params.get("altitude"),
+            accuracy=params.get("accuracy"),
+            battery=params.get("batt"),
+        )
+        return {"status": "ok"}
+
+    try:
+        body = await request.json()
+        location = body["location"]
+        coords = location["coords"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, "Unsupported payload")
+
+    speed = _float(coords.get("speed"))
+    battery = _float((location.get("battery") or {}).get("level"))
+    await ingest(
+        body.get("device_id"),
+        coords.get("latitude"),
+        coords.get("longitude"),
+        location.get("timestamp"),
+        key=device_key(request),
+        speed=speed * KNOTS_PER_MPS if speed is not None and speed >= 0 else None,
+        bearing=coords.get("heading"),
+        altitude=coords.get("altitude"),
+        accuracy=coords.get("accuracy"),
+        battery=battery * 100 if battery is not None and battery >= 0 else None,
+    )
+    return {"status": "ok"}
+
+
+@traccar_router.post("/forward")
+async def forward_event(request: Request):
+    """
+    Traccar server position forwarding (forward.type = json). forward.url is
+    one setting for the whole server, so it can carry the operator's
+    forwarding key instead of a device key.
+    """
+    try:
+        body = await request.json()
+        position = body["position"]
+        device = body.get("device") or {}
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, "Unsupported payload")
+
+    await ingest(
+        device.get("uniqueId") or position.get("uniqueId"),
+        position.get("latitude"),
+        position.get("longitude"),
+        position.get("fixTime") or position.get("deviceTime"),
+        key=device_key(request),
+        forwarded=True,
+        speed=position.get("speed"),
+        bearing=position.get("course"),
+        altitude=position.get("altitude"),
+        accuracy=position.get("accuracy"),
+        battery=(position.get("attributes") or {}).get("batteryLevel"),
+    )
+    return {"status": "ok"}
@@ -0,0 +1,114 @@
+from enum import Enum
+from typing import Annotated, Optional
+from app.core.geo import encode_polyline, simplify
+from app.core.tracks import TrackParseError, build_track, invalidate_route, parse_track_file, route_cache, route_segments
+from models.models import Mission, Step, Track, User
+from beanie import PydanticObjectId
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+
+class RouteFormat(str, Enum):
+    POLYLINE = "polyline"
+    GEOJSON = "geojson"
+
+
+track_router = APIRouter(prefix="/mission")
+
+
+async def get_own_mission(mission_id: PydanticObjectId, user: User) -> Mission:
+    mission = await Mission.get(mission_id)
+    if not mission:
+        raise HTTPException(404, "Mission not found")
+
+    if mission.operator != user.id:
+        raise HTTPException(403, "Forbidden")
+    return mission
+
+
+@track_router.post("/{mission_id}/track")
+async def upload_track(
+    mission_id: PydanticObjectId,
+    request: Request,
+    file: Annotated[UploadFile, File()],
+    step_id: Annotated[Optional[PydanticObjectId], Form()] = None,
+    name: Annotated[Optional[str], Form()] = None,
+):
+    """
+    Attach a GPX or GeoJSON track to a mission, or to one of its steps.
+    """
+    user: User = request.state.user
+    mission = await get_own_mission(mission_id, user)
+
+    if step_id:
+        step = await Step.get(step_id)
+        if not step or step.mission_id != mission.id:
+            raise HTTPException(404, "Step not found")
+
+    try:
+        points, times = await run_in_threadpool(parse_track_file, file.filename, file.file)
+    except TrackParseError as e:
+        raise HTTPException(400, str(e))
+    if len(points) < 2:
+        raise HTTPException(400, "Track has less than two points")
+
+    track = build_track(mission.id, points, times, step_id=step_id, name=name or file.filename)
+    await track.insert()
+    invalidate_route(mission.id)
+
+    return track.model_dump(exclude={"polyline", "time_deltas"})
+
+
+@track_router.get("/{mission_id}/route")
+async def get_route(
+    mission_id: PydanticObjectId,
+    request: Request,
+    tolerance: Annotated[float, Query(ge=0, le=1000, description="Simplification tolerance in meters")] = 5.0,
+    step_id: Optional[PydanticObjectId] = None,
+    format: RouteFormat = RouteFormat.POLYLINE,
+):
+    """
+    Simplified route of a mission or step, one segment per track.
+    """
+    user: User = request.state.user
+    mission = await get_own_mission(mission_id, user)
+
+    key = (mission.id, step_id, tolerance, format)
+    cached = route_cache.get(key)
+    if cached is not None:
+        return cached
+
+    segments = []
+    for track, points in await route_segments(mission.id, step_id):
+        kept = points[simplify(points, tolerance)]
+        segment = {
+            "track_id": track.id,
+            "step_id": track.step_id,
+            "source": track.source,
+            "name": track.name,
+            "point_count": track.point_count,
+            "simplified_count": len(kept),
+        }
+        if format == RouteFormat.GEOJSON:
+            segment["geometry"] = {"type": "LineString", "coordinates": kept[:, ::-1].tolist()}
+        else:
+            segment["polyline"] = encode_polyline(kept)
+        segments.append(segment)
+
+    route = {"mission_id": mission.id, "tolerance": tolerance, "segments": segments}
+    route_cache.set(key, route)
+    return route
+
+
+@track_router.delete("/{mission_id}/track/{track_id}")
+async def delete_track(mission_id: PydanticObjectId, track_id: PydanticObjectId, request: Request):
+    user: User = request.state.user
+    mission = await get_own_mission(mission_id, user)
+
+    track = await Track.get(track_id)
+    if not track or track.mission_id != mission.id:
+        raise HTTPException(404, "Track not found")
+
+    await track.delete()
+    invalidate_route(mission.id)
+    return {"message": "Track deleted"}
@@ -0,0 +1,122 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import UpdateOne
+
+from app.core.config import config
+from app.core.database import transaction
+from app.core.events import on_mission_complete
+from app.core.sketch import sketch_inc
+from models.models import AnalyticsDimension, AnalyticsSummary, Mission, MissionStatus, Step
+
+SummaryKey = Tuple[AnalyticsDimension, str]
+
+
+def _seconds(start: datetime, end: datetime) -> float:
+    return (end - start).total_seconds()
+
+
+def summary_increments(mission: dict, steps: List[dict]) -> Dict[SummaryKey, Dict[str, float]]:
+    """
+    `$inc` updates folding one completed mission into its summaries.
+    """
+    increments: Dict[SummaryKey, Dict[str, float]] = defaultdict(dict)
+
+    def add(keys: List[SummaryKey], updates: Dict[str, float]):
+        for key in keys:
+            for path, value in updates.items():
+                increments[key][path] = increments[key].get(path, 0) + value
+
+    mission_keys: List[SummaryKey] = [(AnalyticsDimension.OVERALL, "all")]
+    if mission.get("mission_template"):
+        mission_keys.append((AnalyticsDimension.TEMPLATE, str(mission["mission_template"])))
+
+    updates = {"missions": 1}
+    if mission.get("start_time") and mission.get("end_time"):
+        updates.update(sketch_inc("mission_duration", _seconds(mission["start_time"], mission["end_time"])))
+    add(mission_keys, updates)
+
+    for step in steps:
+        if not step.get("actual_start"):
+            continue
+        updates = {"steps": 1}
+
+        if step.get("planned_start"):
+            delay = _seconds(step["planned_start"], step["actual_start"])
+            updates.update(sketch_inc("start_delay", delay))
+            if abs(delay) <= config.ANALYTICS_ON_TIME_TOLERANCE:
+                updates["on_time"] = 1
+            else:
+                updates["late" if delay > 0 else "early"] = 1
+
+        if step.get("actual_end"):
+            duration = _seconds(step["actual_start"], step["actual_end"])
+            updates.update(sketch_inc("duration", duration))
+            if step.get("planned_start") and step.get("planned_end"):
+                planned = _seconds(step["planned_start"], step["planned_end"])
+                updates.update(sketch_inc("overrun", duration - planned))
+
+        add(mission_keys + [(AnalyticsDimension.STEP_TYPE, step.get("step_type") or "custom")], updates)
+
+    return increments
+
+
+@on_mission_complete
+async def analyze_mission(mission_id: PydanticObjectId) -> bool:
+    """
+    Fold a completed mission into the operator's summaries, exactly once.
+
+    The mission is claimed by flipping `analyzed` with a conditional update,
+    in the same transaction as the summary writes where supported.
+    """
+    missions = Mission.get_pymongo_collection()
+    async with transaction() as session:
+        mission = await missions.find_one_and_update(
+            {"_id": mission_id, "status": MissionStatus.COMPLETED.value, "analyzed": {"$ne": True}},
+            {"$set": {"analyzed": True}},
+            session=session,
+        )
+        if mission is None:
+            return False
+
+        steps = await Step.get_pymongo_collection().find(
+            {"mission_id": mission_id},
+            {"step_type": 1, "planned_start": 1, "planned_end": 1, "actual_start": 1, "actual_end": 1},
+            session=session,
+        ).to_list()
+
+        now = datetime.utcnow()
+        writes = [
+            UpdateOne(
+                {"operator": mission["operator"], "dimension": dimension.value, "key": key},
+                {"$inc": increments, "$set": {"updated_at": now}},
+                upsert=True,
+            )
+            for (dimension, key), increments in summary_increments(mission, steps).items()
+        ]
+        try:
+            await AnalyticsSummary.get_pymongo_collection().bulk_write(writes, ordered=False, session=session)
+        except Exception:
+            if session is None:
+                # Without a transaction, release the claim so a later catch-up retries.
+                await missions.update_one({"_id": mission_id}, {"$set": {"analyzed": False}})
+            raise
+    return True
+
+
+async def catch_up(operator: PydanticObjectId) -> int:
+    """
+    Fold in completed missions that were not analyzed yet: those completed
+    before analytics existed, or whose background analysis failed.
+    """
+    cursor = Mission.get_pymongo_collection().find(
+        {"operator": operator, "status": MissionStatus.COMPLETED.value, "analyzed": {"$ne": True}},
+        {"_id": 1},
+    ).limit(config.ANALYTICS_CATCH_UP_BATCH)
+
+    analyzed = 0
+    async for mission in cursor:
+        analyzed += await analyze_mission(mission["_id"])
+    return analyzed
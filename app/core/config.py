@@ -1,4 +1,4 @@
-from typing import List, Optional, Union
+from typing import List, Literal, Optional, Union
 
 from pydantic import AnyHttpUrl, field_validator
 from pydantic_settings import BaseSettings
@@ -11,6 +11,28 @@ class Config(BaseSettings):
     DATABASE_NAME: str
     DATABASE_URL: str
 
+    # Connection pool, per worker process: size it as
+    # (concurrent requests per worker) and keep workers * max under the server's limit.
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = None
+    # How long a request waits for a free connection before failing.
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
+    MONGO_CONNECT_TIMEOUT_MS: int = 20000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGO_SOCKET_TIMEOUT_MS: Optional[int] = None
+    # Comma separated, e.g. "zstd,snappy,zlib"; zstd needs `zstandard`, snappy `python-snappy`.
+    MONGO_COMPRESSORS: Optional[str] = None
+    MONGO_READ_PREFERENCE: Literal[
+        "primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"
+    ] = "primary"
+    # Write concern, e.g. "majority" or "1"; the server default when unset.
+    MONGO_WRITE_CONCERN: Optional[str] = None
+    MONGO_JOURNAL: Optional[bool] = None
+    # Readiness probe (/ready): ping timeout, and how long its result is reused.
+    READINESS_TIMEOUT: float = 2.0
+    READINESS_CACHE_TTL: float = 2.0
+
     API_BASE_URL: str
 
     JWT_SECRET_KEY: str
@@ -23,6 +45,82 @@ class Config(BaseSettings):
     SMTP_SENDER: Optional[str] = None
     START_TLS: bool = True
     USE_TLS: bool = False
+    # Email outbox worker: SMTP connections kept open and reused, emails per batch,
+    # retries with exponential backoff, and sends per minute per recipient domain (per worker).
+    EMAIL_SMTP_CONNECTIONS: int = 2
+    EMAIL_SMTP_IDLE_TIMEOUT: float = 30.0
+    EMAIL_BATCH_SIZE: int = 50
+    EMAIL_POLL_INTERVAL: float = 5.0
+    EMAIL_LEASE: float = 300.0
+    EMAIL_MAX_ATTEMPTS: int = 8
+    EMAIL_RETRY_BASE: float = 30.0
+    EMAIL_RETRY_MAX: float = 3600.0
+    EMAIL_DOMAIN_RATE: int = 60
+
+    DASHBOARD_CACHE_TTL: float = 5.0
+    TOKEN_CACHE_TTL: float = 60.0
+    TOKEN_CACHE_SIZE: int = 10000
+
+    PASSWORD_HASH_EXECUTOR: Literal["thread", "process"] = "thread"
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    POSITION_FLUSH_SIZE: int = 500
+    POSITION_FLUSH_INTERVAL: float = 2.0
+    DEVICE_CACHE_TTL: float = 60.0
+    # How long a fix may be linked to a mission/step already changed by another worker.
+    ACTIVE_STEP_CACHE_TTL: float = 5.0
+
+    ROUTE_CACHE_TTL: float = 60.0
+
+    # Fixes less precise than this (meters) never trigger a geofence.
+    GEOFENCE_MAX_ACCURACY: float = 100.0
+    # Distance beyond the radius (meters) before a departure is detected.
+    GEOFENCE_EXIT_MARGIN: float = 20.0
+    GEOFENCE_REFRESH_INTERVAL: float = 60.0
+    # Geofence state of an operator without fixes for this long is dropped.
+    GEOFENCE_IDLE_TTL: float = 3600.0
+
+    ICS_IMPORT_BATCH_SIZE: int = 500
+
+    ANALYTICS_ON_TIME_TOLERANCE: float = 300.0
+    # Completed missions not yet counted, folded in per analytics request.
+    ANALYTICS_CATCH_UP_BATCH: int = 100
+
+    # Closed steps needed before a step template's actuals replace its frozen offsets.
+    TEMPLATE_PREDICTION_MIN_SAMPLES: int = 3
+    TEMPLATE_PREDICTION_QUANTILE: float = 0.5
+
+    # "mongo" relays push events between workers through a change stream (replica set only).
+    PUBSUB_BACKEND: Literal["memory", "mongo"] = "memory"
+    PUSH_QUEUE_SIZE: int = 100
+    PUSH_KEEPALIVE: float = 15.0
+    # How often each worker publishes which operators it has subscribers for
+    # (mongo backend); events for operators nobody subscribes to are not written.
+    PUSH_PRESENCE_INTERVAL: float = 5.0
+    # Lifetime of the ?token= accepted by the push stream.
+    PUSH_TOKEN_TTL: float = 120.0
+
+    # Lifetime of the ?token= accepted by the calendar feed, for subscribing calendar apps.
+    CALENDAR_TOKEN_TTL: float = 365 * 24 * 3600.0
+
+    # Level of the application's loggers (uvicorn configures its own).
+    LOG_LEVEL: str = "INFO"
+
+    # Prometheus metrics on /metrics, per worker process.
+    METRICS_ENABLED: bool = True
+    # Bearer token of /metrics and of the details of /health (routes, pools,
+    # workers); neither is served without one.
+    METRICS_TOKEN: Optional[str] = None
+
+    # Request profiling: every request, or those sending `X-Profile: <PROFILE_TOKEN>`.
+    # Reports (cProfile + MongoDB queries with explain plans) are logged.
+    PROFILE_REQUESTS: bool = False
+    PROFILE_TOKEN: Optional[str] = None
+    PROFILE_EXPLAIN: bool = True
+    PROFILE_TOP_FUNCTIONS: int = 25
+
+    CHECK_INDEXES_ON_STARTUP: bool = True
 
 
     # @field_validator("BACKEND_CORS_ORIGINS")
@@ -1,7 +1,231 @@
-import motor.motor_asyncio
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from time import monotonic, perf_counter
+from typing import AsyncIterator, Optional
+
+from pymongo import AsyncMongoClient, monitoring
+from pymongo.asynchronous.client_session import AsyncClientSession
+from pymongo.asynchronous.database import AsyncDatabase
 from app.core.config import config
+from app.core.metrics import command_monitor, registry
+from app.core.profiling import query_tracer
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters of the client, summed over the servers it talks to.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.open = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait = 0.0
+        self.pool_clears = 0
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def pool_cleared(self, event):
+        self.pool_clears += 1
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_closed(self, event):
+        self.open -= 1
+
+    def connection_checked_out(self, event):
+        self.checkouts += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.checkout_wait += event.duration or 0.0
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            self.checkout_timeouts += 1
+        self.checkout_wait += event.duration or 0.0
 
-client = motor.motor_asyncio.AsyncIOMotorClient(
-    config.DATABASE_URL, uuidRepresentation="standard"
+    def connection_checked_in(self, event):
+        self.in_use -= 1
+
+
+pool_monitor = PoolMonitor()
+
+registry.gauge("mongo_pool_connections_open", "Connections open in the MongoDB pool.", callback=lambda: pool_monitor.open)
+registry.gauge("mongo_pool_connections_in_use", "Connections checked out of the MongoDB pool.", callback=lambda: pool_monitor.in_use)
+registry.counter("mongo_pool_checkouts_total", "Connection checkouts from the MongoDB pool.", callback=lambda: pool_monitor.checkouts)
+registry.counter(
+    "mongo_pool_checkout_timeouts_total", "Checkouts that timed out waiting for a free connection.",
+    callback=lambda: pool_monitor.checkout_timeouts,
 )
-db = client[config.DATABASE_NAME]
\ No newline at end of file
+registry.counter(
+    "mongo_pool_checkout_wait_seconds_total", "Time spent waiting for a connection checkout.",
+    callback=lambda: pool_monitor.checkout_wait,
+)
+
+client: Optional[AsyncMongoClient] = None
+_transactions_supported: Optional[bool] = None
+
+
+def client_options() -> dict:
+    options = {
+        "uuidRepresentation": "standard",
+        "appname": config.PROJECT_NAME,
+        "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": config.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": config.MONGO_READ_PREFERENCE,
+        "event_listeners": [pool_monitor, command_monitor, query_tracer],
+    }
+    optional = {
+        "maxIdleTimeMS": config.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "socketTimeoutMS": config.MONGO_SOCKET_TIMEOUT_MS,
+        "compressors": config.MONGO_COMPRESSORS,
+        "journal": config.MONGO_JOURNAL,
+    }
+    options.update({name: value for name, value in optional.items() if value is not None})
+    if config.MONGO_WRITE_CONCERN:
+        w = config.MONGO_WRITE_CONCERN
+        options["w"] = int(w) if w.isdigit() else w
+    return options
+
+
+def connect() -> AsyncDatabase:
+    """
+    Create the process-wide client (once) and return the application database.
+
+    Beanie 2 drives collections through PyMongo's native async API. The app
+    connects in its lifespan; scripts call this directly and close() when done.
+    """
+    global client
+    if client is None:
+        client = AsyncMongoClient(config.DATABASE_URL, **client_options())
+    return client[config.DATABASE_NAME]
+
+
+def get_client() -> AsyncMongoClient:
+    if client is None:
+        raise RuntimeError("Database client is not connected, call connect() first")
+    return client
+
+
+async def close():
+    global client, _transactions_supported
+    if client is not None:
+        await client.close()
+        client = None
+        _transactions_supported = None
+        pool_monitor.reset()
+
+
+def pool_stats() -> dict:
+    return {
+        "max_pool_size": config.MONGO_MAX_POOL_SIZE,
+        "open": pool_monitor.open,
+        "in_use": pool_monitor.in_use,
+        "peak_in_use": pool_monitor.peak_in_use,
+        "utilization": round(pool_monitor.in_use / config.MONGO_MAX_POOL_SIZE, 3) if config.MONGO_MAX_POOL_SIZE else None,
+        "checkouts": pool_monitor.checkouts,
+        "checkout_failures": pool_monitor.checkout_failures,
+        "checkout_timeouts": pool_monitor.checkout_timeouts,
+        "avg_checkout_wait_ms": round(
+            pool_monitor.checkout_wait * 1000 / max(pool_monitor.checkouts + pool_monitor.checkout_failures, 1), 3
+        ),
+        "pool_clears": pool_monitor.pool_clears,
+    }
+
+
+class ReadinessProbe:
+    """
+    Pings the database with a bounded timeout for the readiness endpoint.
+
+    The result is reused for `ttl` seconds and concurrent checks share one
+    ping, so frequent load balancer probes cost at most one ping per interval.
+    """
+
+    def __init__(self, timeout: float, ttl: float):
+        self.timeout = timeout
+        self.ttl = ttl
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._pending: Optional[asyncio.Future] = None
+
+    async def check(self) -> dict:
+        if self._result is not None and monotonic() - self._checked_at < self.ttl:
+            return self._result
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._probe())
+            self._pending.add_done_callback(self._clear_pending)
+        # Shielded: a probe that disconnects must not cancel the shared ping.
+        return await asyncio.shield(self._pending)
+
+    def _clear_pending(self, _):
+        self._pending = None
+
+    async def _probe(self) -> dict:
+        error = None
+        start = perf_counter()
+        try:
+            await asyncio.wait_for(get_client().admin.command("ping"), self.timeout)
+        except asyncio.TimeoutError:
+            error = f"ping timed out after {self.timeout}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        latency = perf_counter() - start
+
+        self._result = {
+            "ready": error is None,
+            "checked_at": datetime.now(timezone.utc),
+            "database": {
+                "ping_ms": round(latency * 1000, 3) if error is None else None,
+                "error": error,
+            },
+            "pool": pool_stats(),
+        }
+        self._checked_at = monotonic()
+        return self._result
+
+
+readiness = ReadinessProbe(config.READINESS_TIMEOUT, config.READINESS_CACHE_TTL)
+
+
+async def supports_transactions() -> bool:
+    """
+    Multi-document transactions need a replica set or a sharded cluster.
+    """
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await get_client().admin.command("hello")
+        _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[Optional[AsyncClientSession]]:
+    """
+    Yield a session with an open transaction, or None on a standalone server.
+
+    Callers pass the session to every write and, when it is None, undo their
+    partial writes themselves.
+    """
+    if not await supports_transactions():
+        yield None
+        return
+
+    async with get_client().start_session() as session:
+        async with await session.start_transaction():
+            yield session
@@ -1,30 +1,43 @@
-from app.core.config import config
-import aiosmtplib
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
 from email.message import EmailMessage
-from typing import Optional
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
 
+import aiosmtplib
+from pymongo import UpdateOne
 
-async def send_email(
-    to: str,
-    subject: str,
-    body: str,
-    sender: Optional[str] = None,
-):
-    """
-    Send an email using SMTP (works with Mailpit, Mailhog, or real providers).
-    """
-    if not config.SMTP_HOST or not config.SMTP_PORT or not config.SMTP_SENDER:
-        print("SMTP is not configured, skipping email sending.")
-        # TODO: add logging
-        return
+from app.core.config import config
+from app.core.metrics import registry
+from models.models import OutboxEmail, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+# How long shutdown waits for the batch being sent before giving up on it;
+# its emails are sent again once their lease expires.
+STOP_TIMEOUT = 10.0
+
+emails_sent = registry.counter("emails_total", "Outbox emails by delivery outcome.", ("outcome",))
+
+
+def smtp_configured() -> bool:
+    return bool(config.SMTP_HOST and config.SMTP_PORT and config.SMTP_SENDER)
+
+
+def build_message(to: str, subject: str, body: str, sender: Optional[str] = None) -> EmailMessage:
     message = EmailMessage()
     message["From"] = sender or config.SMTP_SENDER
     message["To"] = to
     message["Subject"] = subject
     message.set_content(body)
+    return message
 
-    await aiosmtplib.send(
-        message,
+
+def smtp_client() -> aiosmtplib.SMTP:
+    return aiosmtplib.SMTP(
         hostname=config.SMTP_HOST,
         port=config.SMTP_PORT,
         username=config.SMTP_USER,
@@ -32,3 +45,269 @@ async def send_email(
         start_tls=config.START_TLS,
         use_tls=config.USE_TLS,
     )
+
+
+async def send_email(
+    to: str,
+    subject: str,
+    body: str,
+    sender: Optional[str] = None,
+):
+    """
+    Send an email right away over its own SMTP connection (works with Mailpit,
+    Mailhog, or real providers). Request handlers use enqueue_email instead.
+    """
+    if not smtp_configured():
+        logger.warning("SMTP is not configured, skipping email sending.")
+        return
+
+    async with smtp_client() as smtp:
+        await smtp.send_message(build_message(to, subject, body, sender))
+
+
+async def enqueue_email(
+    to: str,
+    subject: str,
+    body: str,
+    sender: Optional[str] = None,
+):
+    """
+    Store an email in the outbox, one insert; the outbox worker sends it.
+    """
+    if not smtp_configured():
+        logger.warning("SMTP is not configured, skipping email sending.")
+        return
+
+    await OutboxEmail(
+        to=to,
+        domain=to.rpartition("@")[2].lower(),
+        subject=subject,
+        body=body,
+        sender=sender,
+    ).insert()
+    email_outbox.wake()
+
+
+def is_permanent(error: Exception) -> bool:
+    """
+    Whether retrying cannot help: the server rejected the message or its
+    recipient with a 5xx. Connection and authentication errors are retried.
+    """
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(refused.code >= 500 for refused in error.recipients)
+    return (
+        isinstance(error, aiosmtplib.SMTPResponseException)
+        and not isinstance(error, aiosmtplib.SMTPAuthenticationError)
+        and error.code >= 500
+    )
+
+
+class SMTPPool:
+    """
+    Up to `size` SMTP connections, kept open between sends and closed after
+    `idle_timeout` seconds unused.
+    """
+
+    def __init__(self, size: int, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self._semaphore = asyncio.Semaphore(size)
+        self._idle: List[Tuple[aiosmtplib.SMTP, float]] = []
+
+    def _take(self) -> Optional[aiosmtplib.SMTP]:
+        while self._idle:
+            smtp, released_at = self._idle.pop()
+            if smtp.is_connected and monotonic() - released_at < self.idle_timeout:
+                return smtp
+            smtp.close()
+        return None
+
+    async def _send_on(self, smtp: aiosmtplib.SMTP, message: EmailMessage):
+        try:
+            await smtp.send_message(message)
+        except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+            # The server answered, the connection is still usable.
+            self._idle.append((smtp, monotonic()))
+            raise
+        except Exception:
+            smtp.close()
+            raise
+        self._idle.append((smtp, monotonic()))
+
+    async def send(self, message: EmailMessage):
+        async with self._semaphore:
+            smtp = self._take()
+            if smtp is not None:
+                try:
+                    await self._send_on(smtp, message)
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    # Dropped by the server while idle, retry on a new connection.
+                    pass
+
+            smtp = smtp_client()
+            await smtp.connect()
+            await self._send_on(smtp, message)
+
+    def reap(self):
+        now = monotonic()
+        for smtp, released_at in list(self._idle):
+            if now - released_at >= self.idle_timeout or not smtp.is_connected:
+                self._idle.remove((smtp, released_at))
+                smtp.close()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+
+class DomainLimiter:
+    """
+    Token bucket per recipient domain, `rate` sends per minute.
+    """
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def acquire(self, domain: str) -> float:
+        """
+        Take a token for `domain`: 0 if one was available, else the seconds
+        until the next one.
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = monotonic()
+        tokens, updated_at = self._buckets.get(domain, (float(self.rate), now))
+        tokens = min(float(self.rate), tokens + (now - updated_at) * self.rate / 60)
+        if tokens >= 1:
+            self._buckets[domain] = (tokens - 1, now)
+            return 0.0
+        self._buckets[domain] = (tokens, now)
+        return (1 - tokens) * 60 / self.rate
+
+
+class EmailOutbox:
+    """
+    Sends the OutboxEmail queue in the background of every worker process.
+
+    A batch is claimed with three queries whatever its size: due ids, one
+    update_many tagging them with a claim id and a lease, and a find by claim
+    id. Every worker polls, so emails queued by a dead worker still go out,
+    and emails of a worker that died mid-send are retried once their lease
+    expires (delivery is at least once). Outcomes are written back with one
+    bulk_write per batch.
+    """
+
+    def __init__(self):
+        self.pool = SMTPPool(config.EMAIL_SMTP_CONNECTIONS, config.EMAIL_SMTP_IDLE_TIMEOUT)
+        self.limiter = DomainLimiter(config.EMAIL_DOMAIN_RATE)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def wake(self):
+        self._wake.set()
+
+    async def _claim(self) -> List[OutboxEmail]:
+        now = datetime.utcnow()
+        collection = OutboxEmail.get_pymongo_collection()
+        due = {"$or": [
+            {"status": OutboxStatus.PENDING.value, "next_attempt_at": {"$lte": now}},
+            {"status": OutboxStatus.SENDING.value, "locked_until": {"$lt": now}},
+        ]}
+        ids = [
+            email["_id"] for email in
+            await collection.find(due, {"_id": 1}).sort("next_attempt_at", 1).limit(config.EMAIL_BATCH_SIZE).to_list()
+        ]
+        if not ids:
+            return []
+
+        claim = uuid4().hex
+        await collection.update_many(
+            {"_id": {"$in": ids}, **due},
+            {"$set": {
+                "status": OutboxStatus.SENDING.value,
+                "claim": claim,
+                "locked_until": now + timedelta(seconds=config.EMAIL_LEASE),
+            }},
+        )
+        return await OutboxEmail.find(OutboxEmail.claim == claim).to_list()
+
+    async def _deliver(self, email: OutboxEmail) -> UpdateOne:
+        released = {"claim": None, "locked_until": None}
+        wait = self.limiter.acquire(email.domain)
+        if wait:
+            return UpdateOne({"_id": email.id}, {"$set": {
+                **released,
+                "status": OutboxStatus.PENDING.value,
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=wait),
+            }})
+
+        try:
+            await self.pool.send(build_message(email.to, email.subject, email.body, email.sender))
+        except Exception as e:
+            attempts = email.attempts + 1
+            failed = is_permanent(e) or attempts >= config.EMAIL_MAX_ATTEMPTS
+            delay = min(config.EMAIL_RETRY_BASE * 2 ** (attempts - 1), config.EMAIL_RETRY_MAX)
+            emails_sent.inc("failed" if failed else "retry")
+            logger.warning("Failed to send email %s to %s (attempt %d): %s", email.id, email.to, attempts, e)
+            return UpdateOne({"_id": email.id}, {"$set": {
+                **released,
+                "status": (OutboxStatus.FAILED if failed else OutboxStatus.PENDING).value,
+                "attempts": attempts,
+                "last_error": str(e)[:500],
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.8, 1.2)),
+            }})
+
+        emails_sent.inc("sent")
+        return UpdateOne({"_id": email.id}, {
+            "$set": {**released, "status": OutboxStatus.SENT.value, "sent_at": datetime.utcnow()},
+            "$inc": {"attempts": 1},
+        })
+
+    async def process_batch(self) -> int:
+        emails = await self._claim()
+        if not emails:
+            return 0
+        updates = await asyncio.gather(*(self._deliver(email) for email in emails))
+        await OutboxEmail.get_pymongo_collection().bulk_write(updates, ordered=False)
+        return len(emails)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                claimed = await self.process_batch()
+            except Exception:
+                logger.exception("Email outbox batch failed")
+                claimed = 0
+            self.pool.reap()
+
+            if claimed < config.EMAIL_BATCH_SIZE and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), config.EMAIL_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    def start(self):
+        if self._task is None and smtp_configured():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            try:
+                await asyncio.wait_for(self._task, STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            self._task = None
+        await self.pool.close()
+
+
+email_outbox = EmailOutbox()
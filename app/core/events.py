@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from beanie import PydanticObjectId
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MissionChange:
+    """
+    Emitted after a mission or one of its steps is written.
+    """
+    operator_id: PydanticObjectId
+    mission_id: Optional[PydanticObjectId] = None
+    # Pushed to the operator's subscribers (see app.core.pubsub).
+    event: str = "mission.changed"
+    data: Optional[dict] = None
+
+
+MissionChangeListener = Callable[[MissionChange], None]
+
+_listeners: List[MissionChangeListener] = []
+
+
+def on_mission_change(listener: MissionChangeListener) -> MissionChangeListener:
+    """
+    Register a listener for mission/step writes. Usable as a decorator.
+    """
+    _listeners.append(listener)
+    return listener
+
+
+def mission_changed(
+    operator_id: PydanticObjectId,
+    mission_id: Optional[PydanticObjectId] = None,
+    event: str = "mission.changed",
+    data: Optional[dict] = None,
+):
+    """
+    Notify in-process listeners (caches, indexes, push) that an operator's missions changed.
+    """
+    change = MissionChange(operator_id=operator_id, mission_id=mission_id, event=event, data=data)
+    for listener in _listeners:
+        listener(change)
+
+
+MissionCompleteListener = Callable[[PydanticObjectId], Awaitable[None]]
+
+_complete_listeners: List[MissionCompleteListener] = []
+_background_tasks: set = set()
+
+
+def on_mission_complete(listener: MissionCompleteListener) -> MissionCompleteListener:
+    """
+    Register a coroutine run in the background for every completed mission.
+    Usable as a decorator.
+    """
+    _complete_listeners.append(listener)
+    return listener
+
+
+async def _run_complete_listener(listener: MissionCompleteListener, mission_id: PydanticObjectId):
+    try:
+        await listener(mission_id)
+    except Exception:
+        logger.exception("%s failed for mission %s", listener.__name__, mission_id)
+
+
+def mission_completed(mission_id: PydanticObjectId):
+    """
+    Run the completion listeners (track archival, analytics) without delaying the response.
+    """
+    for listener in _complete_listeners:
+        task = asyncio.create_task(_run_complete_listener(listener, mission_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
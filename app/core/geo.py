@@ -0,0 +1,140 @@
+import math
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+# Google encoded polyline precision: 1e-5 degrees, about 1.1 m.
+POLYLINE_PRECISION = 5
+
+
+def to_local_meters(points: np.ndarray) -> np.ndarray:
+    """
+    Project (lat, lon) degrees onto a local equirectangular plane in meters.
+
+    Accurate enough for distances within a single walk or drive.
+    """
+    lat0 = np.radians(points[:, 0].mean())
+    return np.column_stack((
+        np.radians(points[:, 1]) * np.cos(lat0),
+        np.radians(points[:, 0]),
+    )) * EARTH_RADIUS_M
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters between two (lat, lon) points."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of a (n, 2) array of (lat, lon) degrees.
+
+    `tolerance` is in meters. Returns the boolean mask of the points to keep.
+    Segments are processed from an explicit stack and the distances of every
+    point of a segment are computed in one vectorized pass.
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if n < 3:
+        return keep
+
+    xy = to_local_meters(points)
+    stack: List[Tuple[int, int]] = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        a, b = xy[start], xy[end]
+        inner = xy[start + 1:end]
+        ab = b - a
+        length_sq = ab @ ab
+        if length_sq == 0:
+            distances = np.hypot(*(inner - a).T)
+        else:
+            t = np.clip(((inner - a) @ ab) / length_sq, 0.0, 1.0)
+            distances = np.hypot(*(inner - (a + t[:, None] * ab)).T)
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def _encode_signed(values: Iterable[int], chunks: List[str]):
+    for value in values:
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+
+
+def encode_polyline(points: np.ndarray, precision: int = POLYLINE_PRECISION) -> str:
+    """
+    Google encoded polyline of a (n, 2) array of (lat, lon) degrees.
+    """
+    if len(points) == 0:
+        return ""
+    scaled = np.round(np.asarray(points, dtype=float) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    chunks: List[str] = []
+    _encode_signed(deltas.ravel().tolist(), chunks)
+    return "".join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> np.ndarray:
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1F) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    deltas = np.array(values, dtype=np.int64).reshape(-1, 2)
+    return np.cumsum(deltas, axis=0) / 10 ** precision
+
+
+def encode_deltas(values: Iterable[int]) -> bytes:
+    """
+    Zigzag varint encoding of the successive differences of integers
+    (e.g. fix timestamps in seconds): one byte per delta below 64.
+    """
+    out = bytearray()
+    previous = 0
+    for value in values:
+        delta, previous = value - previous, value
+        zigzag = (delta << 1) ^ (delta >> 63)
+        while zigzag >= 0x80:
+            out.append((zigzag & 0x7F) | 0x80)
+            zigzag >>= 7
+        out.append(zigzag)
+    return bytes(out)
+
+
+def decode_deltas(data: Optional[bytes]) -> List[int]:
+    values = []
+    previous = value = shift = 0
+    for byte in data or b"":
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            previous += (value >> 1) ^ -(value & 1)
+            values.append(previous)
+            value = shift = 0
+    return values
@@ -0,0 +1,159 @@
+import itertools
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Optional, Tuple
+
+from beanie import PydanticObjectId
+
+from app.core.cache import TTLCache
+from app.core.config import config
+from app.core.events import MissionChange, on_mission_change, on_mission_complete
+from app.core.geo import haversine
+from app.core.positions import active_missions_by_operator
+from models.models import Location, Position, StepType
+
+
+class GeofenceEvent(str, Enum):
+    ARRIVAL = "arrival"
+    DEPARTURE = "departure"
+
+
+@dataclass
+class Geofence:
+    """
+    Location radius of an operator's active step.
+
+    A movement step ends on arrival at its location; any other step with a
+    location ends on departure, once the operator has been seen inside.
+    """
+    mission_id: PydanticObjectId
+    progress_version: int
+    step_id: PydanticObjectId
+    step_type: StepType
+    activated_at: Optional[datetime]
+    lat: float
+    lon: float
+    radius: float
+    inside: bool = False
+    fired: bool = False
+
+    @property
+    def trigger(self) -> GeofenceEvent:
+        return GeofenceEvent.ARRIVAL if self.step_type == StepType.MOVEMENT else GeofenceEvent.DEPARTURE
+
+    def check(self, lat: float, lon: float, accuracy: Optional[float], timestamp: datetime) -> Optional[GeofenceEvent]:
+        if self.fired:
+            return None
+        if accuracy is not None and accuracy > config.GEOFENCE_MAX_ACCURACY:
+            return None
+        # Fixes replayed from before the step started say nothing about it.
+        if self.activated_at and timestamp < self.activated_at:
+            return None
+
+        distance = haversine(self.lat, self.lon, lat, lon)
+        if distance <= self.radius:
+            self.inside = True
+            if self.trigger == GeofenceEvent.ARRIVAL:
+                self.fired = True
+                return GeofenceEvent.ARRIVAL
+        elif (
+            self.inside
+            and self.trigger == GeofenceEvent.DEPARTURE
+            and distance > self.radius + config.GEOFENCE_EXIT_MARGIN
+        ):
+            self.fired = True
+            return GeofenceEvent.DEPARTURE
+        return None
+
+
+async def load_geofence(operator: PydanticObjectId) -> Optional[Geofence]:
+    mission, step = (await active_missions_by_operator([operator])).get(operator) or (None, None)
+    if not step or not step.location:
+        return None
+    location = await Location.get(step.location)
+    if not location:
+        return None
+
+    return Geofence(
+        mission_id=mission.id,
+        progress_version=mission.progress_version,
+        step_id=step.id,
+        step_type=step.step_type,
+        activated_at=step.actual_start,
+        lat=location.coordinates.lat,
+        lon=location.coordinates.lon,
+        radius=location.radius,
+    )
+
+
+class GeofenceIndex:
+    """
+    In-memory index of each operator's active geofence.
+
+    An operator's entry is loaded on their first fix and dropped whenever one
+    of their missions or steps changes, so evaluating a fix is a dict lookup
+    and one distance computation. Entries are also reloaded every
+    `refresh_interval` seconds to pick up writes made by other workers, and
+    dropped after `idle_ttl` seconds without a fix, when their mission
+    completes, or when a device of the operator is removed.
+    """
+
+    def __init__(self, refresh_interval: float, idle_ttl: float, maxsize: int = 10000):
+        self.refresh_interval = refresh_interval
+        # operator -> (load id, loaded at or None while loading, geofence or None
+        # when the operator has none). Invalidation drops the entry, so a load
+        # only caches its result if its own entry is still there.
+        self._entries: TTLCache[Tuple[int, Optional[float], Optional[Geofence]]] = TTLCache(
+            ttl=idle_ttl, maxsize=maxsize
+        )
+        self._load_ids = itertools.count()
+
+    def invalidate(self, operator: PydanticObjectId):
+        self._entries.invalidate(operator)
+
+    def invalidate_mission(self, mission_id: PydanticObjectId):
+        self._entries.invalidate_where(lambda _, entry: entry[2] is not None and entry[2].mission_id == mission_id)
+
+    async def get(self, operator: PydanticObjectId) -> Optional[Geofence]:
+        entry = self._entries.get(operator)
+        if entry is not None and entry[1] is not None and time.monotonic() - entry[1] < self.refresh_interval:
+            return entry[2]
+
+        previous = entry[2] if entry is not None else None
+        load_id = next(self._load_ids)
+        self._entries.set(operator, (load_id, None, previous))
+        geofence = await load_geofence(operator)
+        if previous is not None and geofence is not None and previous.step_id == geofence.step_id:
+            geofence.inside, geofence.fired = previous.inside, previous.fired
+        # Skip caching when the operator's missions changed while loading.
+        current = self._entries.get(operator)
+        if current is not None and current[0] == load_id:
+            self._entries.set(operator, (load_id, time.monotonic(), geofence))
+        return geofence
+
+    async def evaluate(self, position: Position) -> Optional[Tuple[Geofence, GeofenceEvent]]:
+        geofence = await self.get(position.meta.operator)
+        if geofence is None:
+            return None
+        event = geofence.check(
+            position.coordinates.lat, position.coordinates.lon, position.accuracy, position.timestamp
+        )
+        return (geofence, event) if event else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+geofences = GeofenceIndex(config.GEOFENCE_REFRESH_INTERVAL, config.GEOFENCE_IDLE_TTL)
+
+
+@on_mission_change
+def _invalidate_geofence(change: MissionChange):
+    geofences.invalidate(change.operator_id)
+
+
+@on_mission_complete
+async def _evict_completed_geofence(mission_id: PydanticObjectId):
+    geofences.invalidate_mission(mission_id)
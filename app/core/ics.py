@@ -0,0 +1,231 @@
+import codecs
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, Optional, Protocol
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+_DURATION = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+
+class ICSError(ValueError):
+    pass
+
+
+class AsyncReadable(Protocol):
+    async def read(self, size: int = -1) -> bytes: ...
+
+
+@dataclass
+class Property:
+    name: str
+    value: str
+    params: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Event:
+    """
+    One VEVENT, as the first occurrence of each property name.
+    """
+    properties: Dict[str, Property] = field(default_factory=dict)
+
+    def get(self, name: str) -> Optional[str]:
+        prop = self.properties.get(name)
+        return unescape(prop.value) if prop else None
+
+    def get_datetime(self, name: str) -> Optional[datetime]:
+        prop = self.properties.get(name)
+        return parse_datetime(prop.value, prop.params.get("TZID")) if prop else None
+
+    @property
+    def key(self) -> Optional[str]:
+        """UID, qualified by RECURRENCE-ID for overridden occurrences."""
+        uid = self.get("UID")
+        recurrence_id = self.properties.get("RECURRENCE-ID")
+        if uid and recurrence_id:
+            return f"{uid}#{recurrence_id.value}"
+        return uid
+
+    @property
+    def start(self) -> Optional[datetime]:
+        return self.get_datetime("DTSTART")
+
+    @property
+    def end(self) -> Optional[datetime]:
+        end = self.get_datetime("DTEND")
+        duration = self.properties.get("DURATION")
+        if end is None and duration and self.start:
+            end = self.start + parse_duration(duration.value)
+        return end
+
+    @property
+    def parent(self) -> Optional[str]:
+        """UID of the parent event (RELATED-TO, RELTYPE=PARENT by default)."""
+        related = self.properties.get("RELATED-TO")
+        if related and related.params.get("RELTYPE", "PARENT").upper() == "PARENT":
+            return unescape(related.value)
+        return None
+
+
+async def iter_lines(source: AsyncReadable) -> AsyncIterator[str]:
+    """
+    Unfolded content lines of an iCalendar stream, read in chunks.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    current: Optional[str] = None
+    while True:
+        chunk = await source.read(CHUNK_SIZE)
+        buffer += decoder.decode(chunk or b"", final=not chunk)
+        *lines, buffer = buffer.split("\n")
+        if not chunk:
+            lines.append(buffer)
+        for line in lines:
+            line = line.rstrip("\r")
+            if line[:1] in (" ", "\t") and current is not None:
+                current += line[1:]
+                continue
+            if current:
+                yield current
+            current = line
+        if not chunk:
+            break
+    if current:
+        yield current
+
+
+def parse_line(line: str) -> Property:
+    """NAME;PARAM=VALUE;...:VALUE, with quoted parameter values."""
+    in_quotes = False
+    for i, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        raise ICSError(f"Malformed content line: {line[:80]}")
+
+    name, *raw_params = re.split(r';(?=(?:[^"]*"[^"]*")*[^"]*$)', head)
+    params = {}
+    for raw in raw_params:
+        key, _, param_value = raw.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return Property(name=name.upper(), value=value, params=params)
+
+
+async def iter_events(
+    source: AsyncReadable, on_error: Optional[Callable[[ICSError], None]] = None
+) -> AsyncIterator[Event]:
+    """
+    VEVENTs of an iCalendar stream, one at a time. Nested components
+    (VALARM) are skipped, as are VTODO/VJOURNAL/VTIMEZONE. Malformed lines
+    are skipped and passed to `on_error`.
+    """
+    event: Optional[Event] = None
+    depth = 0
+    async for line in iter_lines(source):
+        if not line.strip():
+            continue
+        try:
+            prop = parse_line(line)
+        except ICSError as e:
+            logger.debug("Skipping %s", e)
+            if on_error is not None:
+                on_error(e)
+            continue
+        if prop.name == "BEGIN":
+            if event is not None:
+                depth += 1
+            elif prop.value.upper() == "VEVENT":
+                event = Event()
+        elif prop.name == "END":
+            if event is None:
+                continue
+            if depth:
+                depth -= 1
+            elif prop.value.upper() == "VEVENT":
+                yield event
+                event = None
+        elif event is not None and not depth:
+            event.properties.setdefault(prop.name, prop)
+
+
+def parse_datetime(value: str, tzid: Optional[str] = None) -> datetime:
+    """
+    DATE or DATE-TIME value as naive UTC. Floating times are taken as UTC.
+    """
+    try:
+        if "T" not in value:
+            return datetime.combine(date(int(value[:4]), int(value[4:6]), int(value[6:8])), datetime.min.time())
+        parsed = datetime.strptime(value.rstrip("Z")[:15], "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise ICSError(f"Invalid date: {value}")
+
+    if value.endswith("Z"):
+        return parsed
+    if tzid:
+        try:
+            parsed = parsed.replace(tzinfo=ZoneInfo(tzid))
+        except (ZoneInfoNotFoundError, ValueError):
+            return parsed
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_duration(value: str) -> timedelta:
+    match = _DURATION.match(value.strip())
+    if not match:
+        raise ICSError(f"Invalid duration: {value}")
+    parts = {name: int(number or 0) for name, number in match.groupdict().items() if name != "sign"}
+    duration = timedelta(**parts)
+    return -duration if match.group("sign") == "-" else duration
+
+
+def unescape(value: str) -> str:
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def format_datetime(value: datetime) -> str:
+    """Naive UTC datetime as an iCalendar UTC DATE-TIME."""
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def fold(line: str) -> str:
+    """
+    Fold a content line at 75 octets, without splitting UTF-8 sequences.
+    """
+    encoded = line.encode("utf-8")
+    parts = []
+    limit = 75
+    while len(encoded) > limit:
+        cut = limit
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+        # Continuation lines start with a space.
+        limit = 74
+    parts.append(encoded.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def content_line(name: str, value: str, **params: str) -> str:
+    head = name + "".join(f";{key}={param}" for key, param in params.items())
+    return fold(f"{head}:{value}")
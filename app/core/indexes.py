@@ -0,0 +1,78 @@
+from typing import Iterable, List, Set, Tuple, Type
+
+from beanie import Document
+from beanie.odm.fields import IndexModelField
+from pymongo import IndexModel
+
+IndexKey = Tuple[Tuple[str, object], ...]
+
+
+def _normalize_key(key: Iterable) -> IndexKey:
+    normalized = []
+    for field, direction in key:
+        if isinstance(direction, float):
+            direction = int(direction)
+        normalized.append((field, direction))
+    return tuple(normalized)
+
+
+def _server_key(key: Iterable) -> IndexKey:
+    """
+    Key of an index as listed by the server: text fields are stored as one
+    ("_fts", "text"), ("_ftsx", 1) pair in place of the declared fields.
+    """
+    normalized = []
+    for field, direction in _normalize_key(key):
+        if direction != "text":
+            normalized.append((field, direction))
+        elif ("_fts", "text") not in normalized:
+            normalized += [("_fts", "text"), ("_ftsx", 1)]
+    return tuple(normalized)
+
+
+def declared_index_keys(model: Type[Document]) -> Set[IndexKey]:
+    keys = set()
+    for index in model.get_settings().indexes or []:
+        if isinstance(index, IndexModelField):
+            index = index.index
+        if isinstance(index, IndexModel):
+            keys.add(_server_key(index.document["key"].items()))
+        elif isinstance(index, str):
+            keys.add(((index, 1),))
+    return keys
+
+
+async def check_indexes(document_models: List[Type[Document]]) -> List[str]:
+    """
+    Compare declared indexes with the ones present in the database.
+
+    Reports indexes that are declared but missing, present but undeclared,
+    and present but never used since the server started ($indexStats).
+    Returns the report lines so callers can decide where to send them.
+    """
+    report = []
+    for model in document_models:
+        collection = model.get_pymongo_collection()
+        collection_name = model.get_collection_name()
+        declared = declared_index_keys(model)
+
+        existing = {
+            name: _normalize_key(info["key"])
+            for name, info in (await collection.index_information()).items()
+            if name != "_id_"
+        }
+        for key in declared - set(existing.values()):
+            report.append(f"{collection_name}: missing index {dict(key)}")
+        for name, key in existing.items():
+            if key not in declared:
+                report.append(f"{collection_name}: undeclared index {name} {dict(key)}")
+
+        cursor = await collection.aggregate([{"$indexStats": {}}])
+        async for stats in cursor:
+            if stats["name"] == "_id_" or stats["accesses"]["ops"]:
+                continue
+            report.append(
+                f"{collection_name}: index {stats['name']} unused since {stats['accesses']['since']:%Y-%m-%d %H:%M}"
+            )
+
+    return report
@@ -2,14 +2,47 @@ from beanie import PydanticObjectId
 import jwt
 import datetime
 
-from fastapi import HTTPException, Header
+from fastapi import HTTPException, Header, Query, Request
 from pydantic import BaseModel
 
+from app.core.cache import TTLCache
+from app.core.config import config
+from models.models import User
+
 class DecodedToken(BaseModel):
     expire: float
     id: PydanticObjectId
     username: str
     email: str | None = None
+    # Set on restricted tokens: "events" for the push stream, "calendar" for the
+    # calendar feed. login_required rejects them.
+    scope: str | None = None
+
+
+# Verified tokens and their users, keyed by the raw token string. The user can
+# be up to TOKEN_CACHE_TTL old on workers other than the one that changed it:
+# handlers that check credentials or write to the user load it with fresh_user().
+token_cache: TTLCache[tuple[DecodedToken, User]] = TTLCache(
+    ttl=config.TOKEN_CACHE_TTL, maxsize=config.TOKEN_CACHE_SIZE
+)
+
+
+def invalidate_user_tokens(user_id: PydanticObjectId):
+    """
+    Drop every cached token of a user, e.g. after a password or email change.
+    """
+    token_cache.invalidate_where(lambda _, cached: cached[0].id == user_id)
+
+async def fresh_user(request: Request) -> User:
+    """
+    The request's user as currently stored, for handlers that check its
+    credentials or write to it; request.state.user may come from the cache.
+    """
+    user = await User.get(request.state.token.id)
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return user
+
 
 class FastJWT:
     def __init__(self):
@@ -29,6 +62,15 @@ class FastJWT:
         jwt_token = jwt.encode(token_json, self.secret_key, algorithm="HS256")
 
         return jwt_token
+
+
+    async def encode_scoped(self, user: User, scope: str, ttl: float) -> tuple[str, float]:
+        """
+        (token, expire) of a token of `user` restricted to `scope`, valid for `ttl` seconds.
+        """
+        expire = (datetime.datetime.now() + datetime.timedelta(seconds=ttl)).timestamp()
+        token = await self.encode({"id": str(user.id), "username": user.username, "scope": scope}, expire)
+        return token, expire
     
 
     async def decode(self, payload) -> DecodedToken:
@@ -39,16 +81,74 @@ class FastJWT:
         )
 
 
-    async def login_required(self, Authorization=Header("Authorization")):
+    async def login_required(self, request: Request, Authorization=Header("Authorization")):
+        """
+        Verify the token once per request and expose it and its user as
+        `request.state.token` and `request.state.user`.
+        """
+        now = datetime.datetime.now().timestamp()
+        cached = token_cache.get(Authorization)
+        if cached is None:
+            try:
+                if Authorization == "Authorization":
+                    raise
+
+                jwt_token = await self.decode(Authorization)
+
+                if jwt_token.expire < int(now) or jwt_token.scope is not None:
+                    raise
+
+            except Exception as e:
+                print(e)
+                raise HTTPException(status_code=401, detail="Unauthorized")
+
+            user = await User.get(jwt_token.id)
+            if not user:
+                raise HTTPException(status_code=401, detail="Unauthorized")
+
+            cached = (jwt_token, user)
+            token_cache.set(Authorization, cached, ttl=min(config.TOKEN_CACHE_TTL, jwt_token.expire - now))
+
+        elif cached[0].expire < int(now):
+            token_cache.invalidate(Authorization)
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+        # A copy per request: handlers must not mutate the instance shared by
+        # concurrent requests of the same token.
+        request.state.token = cached[0]
+        request.state.user = cached[1].model_copy()
+
+
+    async def scoped_login_required(self, request: Request, token: str | None, Authorization: str, scope: str):
+        """
+        login_required that also accepts a token restricted to `scope` as
+        `?token=`, for clients that cannot send an Authorization header.
+        """
+        if token is None:
+            return await self.login_required(request, Authorization)
+
         try:
-            if Authorization == "Authorization":
-                raise
-            
-            jwt_token = await self.decode(Authorization)
+            jwt_token = await self.decode(token)
+        except Exception:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        if jwt_token.scope != scope or jwt_token.expire < datetime.datetime.now().timestamp():
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+        user = await User.get(jwt_token.id)
+        if not user:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        request.state.token, request.state.user = jwt_token, user
+
+
+    async def events_login_required(
+        self, request: Request, token: str | None = Query(None), Authorization=Header("Authorization")
+    ):
+        """Push stream: browsers' EventSource cannot send headers."""
+        await self.scoped_login_required(request, token, Authorization, "events")
 
-            if jwt_token.expire < int(datetime.datetime.now().timestamp()):
-                raise
 
-        except Exception as e:
-            print(e)
-            raise HTTPException(status_code=401, detail="Unauthorized")
\ No newline at end of file
+    async def calendar_login_required(
+        self, request: Request, token: str | None = Query(None), Authorization=Header("Authorization")
+    ):
+        """Calendar feed: subscribing calendar apps only fetch a URL."""
+        await self.scoped_login_required(request, token, Authorization, "calendar")
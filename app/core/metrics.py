@@ -0,0 +1,266 @@
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+LabelValues = Tuple[str, ...]
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COMMANDS_PER_REQUEST_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, le: Optional[str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(Metric):
+    """
+    A value that only goes up. With `callback`, the unlabeled value is read
+    at scrape time instead, for counts kept elsewhere.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            self._values[()] = self.callback()
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = HTTP_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float):
+        counts, total = self._values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, _format_value(bound))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, '+Inf')} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics of this worker process, rendered in the Prometheus text format.
+    Each worker is scraped on its own; aggregate across workers in Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = (), callback=None) -> Counter:
+        return self.register(Counter(name, help, labels, callback))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=HTTP_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")
+)
+http_errors = registry.counter(
+    "http_request_errors_total", "HTTP requests answered with a 5xx or an unhandled exception.", ("method", "route")
+)
+http_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the response body is sent.", ("method", "route")
+)
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled.")
+
+mongo_commands = registry.counter(
+    "mongo_commands_total", "MongoDB commands by name and outcome.", ("command", "outcome")
+)
+mongo_duration = registry.histogram(
+    "mongo_command_duration_seconds", "MongoDB command round trip, as measured by the driver.", ("command",),
+    buckets=MONGO_BUCKETS,
+)
+mongo_commands_per_request = registry.histogram(
+    "mongo_commands_per_request", "MongoDB commands issued while handling one HTTP request.", ("method", "route"),
+    buckets=COMMANDS_PER_REQUEST_BUCKETS,
+)
+mongo_time_per_request = registry.histogram(
+    "mongo_time_per_request_seconds", "MongoDB command time spent while handling one HTTP request.", ("method", "route"),
+    buckets=HTTP_BUCKETS,
+)
+
+
+class RequestStats:
+    __slots__ = ("commands", "mongo_time")
+
+    def __init__(self):
+        self.commands = 0
+        self.mongo_time = 0.0
+
+
+# Stats of the request being handled. Tasks spawned by a handler copy the
+# context, so their commands count toward the request that started them.
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def detach_request_stats():
+    """
+    Stop counting the current context's commands towards its request, for
+    tasks that a request spawns but that are not part of its work.
+    """
+    _request_stats.set(None)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Counts driver commands globally and for the current request. Listeners
+    run inline in the task awaiting the command, so the context is the request's.
+    """
+
+    def started(self, event):
+        pass
+
+    def _record(self, event, outcome: str):
+        duration = event.duration_micros / 1e6
+        mongo_commands.inc(event.command_name, outcome)
+        mongo_duration.observe(event.command_name, value=duration)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.mongo_time += duration
+
+    def succeeded(self, event):
+        self._record(event, "success")
+
+    def failed(self, event):
+        self._record(event, "failure")
+
+
+command_monitor = CommandMonitor()
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and MongoDB usage of every HTTP request, labeled
+    by route template (`/api/private/mission/{mission_id}`) to bound cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        http_in_flight.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            http_in_flight.dec()
+            _request_stats.reset(token)
+
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", None) or "unmatched")
+            http_requests.inc(*labels, str(status))
+            http_duration.observe(*labels, value=elapsed)
+            if status >= 500:
+                http_errors.inc(*labels)
+            mongo_commands_per_request.observe(*labels, value=stats.commands)
+            mongo_time_per_request.observe(*labels, value=stats.mongo_time)
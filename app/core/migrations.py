@@ -0,0 +1,140 @@
+from pymongo import UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+
+from models.models import POSITION_RETENTION_SECONDS
+
+# Documents per bulk_write of migrations that rewrite documents one by one.
+MIGRATION_BATCH_SIZE = 1000
+
+
+async def migrate_location_coordinates(database: AsyncDatabase) -> int:
+    """
+    Rewrite Location.coordinates stored as {lat, lon} into GeoJSON Points.
+
+    Must run before init_beanie: the 2dsphere index cannot be built while
+    legacy documents exist. Idempotent, returns the number of documents updated.
+    """
+    result = await database["Location"].update_many(
+        {"coordinates.lat": {"$exists": True}, "coordinates.lon": {"$exists": True}},
+        [{"$set": {"coordinates": {
+            "type": "Point",
+            "coordinates": ["$coordinates.lon", "$coordinates.lat"],
+        }}}],
+    )
+    return result.modified_count
+
+
+async def migrate_note_operators(database: AsyncDatabase) -> int:
+    """
+    Set Note.operator, required since notes are searched per operator, from
+    the note's mission on notes written before the field existed. Notes of
+    deleted missions are unreachable (listing checks the mission) and stay
+    as they are. Idempotent, returns the number of notes updated.
+    """
+    cursor = await database["Note"].aggregate([
+        {"$match": {"operator": {"$exists": False}}},
+        {"$lookup": {"from": "Mission", "localField": "mission_id", "foreignField": "_id", "as": "mission"}},
+        {"$unwind": "$mission"},
+        {"$project": {"operator": "$mission.operator"}},
+    ])
+    updated = 0
+    updates = []
+    async for note in cursor:
+        updates.append(UpdateOne({"_id": note["_id"]}, {"$set": {"operator": note["operator"]}}))
+        if len(updates) == MIGRATION_BATCH_SIZE:
+            updated += (await database["Note"].bulk_write(updates, ordered=False)).modified_count
+            updates = []
+    if updates:
+        updated += (await database["Note"].bulk_write(updates, ordered=False)).modified_count
+    return updated
+
+
+async def migrate_position_retention(database: AsyncDatabase) -> bool:
+    """
+    Apply POSITION_RETENTION_SECONDS to a Position collection created before
+    fixes expired; init_beanie only sets it on collections it creates.
+    Returns whether the collection was changed.
+    """
+    collections = await (await database.list_collections(filter={"name": "Position"})).to_list()
+    if not collections or collections[0].get("options", {}).get("expireAfterSeconds") == POSITION_RETENTION_SECONDS:
+        return False
+    await database.command({"collMod": "Position", "expireAfterSeconds": POSITION_RETENTION_SECONDS})
+    return True
+
+
+async def migrate_template_counters(database: AsyncDatabase) -> int:
+    """
+    Drop TemplateCounter documents keyed by template id, and their unique
+    index, which would reject the name-keyed counters. Their numbers are
+    recovered from the missions' names when a counter is next created.
+    Must run before init_beanie. Returns the number of counters dropped.
+    """
+    collection = database["TemplateCounter"]
+    if not await _has_index(collection, "operator_template_unique"):
+        return 0
+    await collection.drop_index("operator_template_unique")
+    result = await collection.delete_many({"template_name": {"$exists": False}})
+    return result.deleted_count
+
+
+async def _has_index(collection: AsyncCollection, name: str) -> bool:
+    indexes = await (await collection.list_indexes()).to_list()
+    return any(index["name"] == name for index in indexes)
+
+
+async def _duplicate_groups(collection: AsyncCollection, key: dict) -> list:
+    """Ids of the documents sharing each duplicated `key`, oldest first."""
+    cursor = await collection.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": key, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    return await cursor.to_list()
+
+
+async def migrate_duplicate_location_names(database: AsyncDatabase) -> int:
+    """
+    Rename locations sharing a name to "<name> (2)", "<name> (3)", ... so the
+    unique name index can be built. The oldest keeps the name; steps refer to
+    locations by id and are unaffected. Skipped once the index exists.
+    Must run before init_beanie. Returns the number of locations renamed.
+    """
+    collection = database["Location"]
+    if await _has_index(collection, "name_unique"):
+        return 0
+
+    renamed = 0
+    for group in await _duplicate_groups(collection, "$name"):
+        name, suffix = group["_id"], 1
+        for location_id in group["ids"][1:]:
+            while True:
+                suffix += 1
+                new_name = f"{name} ({suffix})"
+                if not await collection.find_one({"name": new_name}, {"_id": 1}):
+                    break
+            await collection.update_one({"_id": location_id}, {"$set": {"name": new_name}})
+            renamed += 1
+    return renamed
+
+
+async def migrate_duplicate_step_orders(database: AsyncDatabase) -> int:
+    """
+    Renumber the steps of missions where several steps share an order, 1..n
+    by (order, _id), so the unique (mission_id, order) index can be built.
+    Skipped once the index exists. Must run before init_beanie. Returns the
+    number of missions renumbered.
+    """
+    collection = database["Step"]
+    if await _has_index(collection, "mission_order_unique"):
+        return 0
+
+    groups = await _duplicate_groups(collection, {"mission_id": "$mission_id", "order": "$order"})
+    mission_ids = {group["_id"]["mission_id"] for group in groups}
+    for mission_id in mission_ids:
+        steps = await collection.find({"mission_id": mission_id}, {"_id": 1}).sort([("order", 1), ("_id", 1)]).to_list()
+        await collection.bulk_write(
+            [UpdateOne({"_id": step["_id"]}, {"$set": {"order": order}}) for order, step in enumerate(steps, 1)],
+            ordered=False,
+        )
+    return len(mission_ids)
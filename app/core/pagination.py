@@ -0,0 +1,85 @@
+from functools import lru_cache
+from typing import Annotated, Optional, Tuple, Type
+
+from beanie import Document, PydanticObjectId
+from beanie.odm.queries.find import FindMany
+from fastapi import HTTPException, Query, Response
+from pydantic import BaseModel, ConfigDict, Field, create_model
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """
+    Query parameters shared by the list endpoints.
+
+    `cursor` is the `_id` of the last item of the previous page, as returned in
+    the X-Next-Cursor response header. `fields` is a comma separated list of
+    document fields to return instead of the full documents.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+        fields: Optional[str] = None,
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = fields
+
+
+@lru_cache(maxsize=128)
+def _projection_model(model: Type[Document], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    return create_model(
+        f"{model.__name__}Projection",
+        __config__=ConfigDict(populate_by_name=True),
+        id=(PydanticObjectId, Field(alias="_id")),
+        **{name: (Optional[model.model_fields[name].annotation], None) for name in fields},
+    )
+
+
+def projection_model(model: Type[Document], fields: Optional[str]) -> Optional[Type[BaseModel]]:
+    """
+    Build (and memoize) a projection model holding `_id` plus the requested fields.
+    """
+    if not fields:
+        return None
+    names = tuple(sorted({name.strip() for name in fields.split(",") if name.strip()} - {"id", "_id"}))
+    unknown = [name for name in names if name not in model.model_fields or model.model_fields[name].exclude]
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+    return _projection_model(model, names)
+
+
+def decode_cursor(cursor: str) -> PydanticObjectId:
+    try:
+        return PydanticObjectId(cursor)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+
+async def paginate(query: FindMany, page: PageParams, response: Response) -> list:
+    """
+    Keyset pagination on `_id`, newest first.
+
+    Fetches one extra document to know whether another page exists and, if so,
+    exposes its cursor in the X-Next-Cursor header.
+    """
+    if page.cursor:
+        query = query.find({"_id": {"$lt": decode_cursor(page.cursor)}})
+    query = query.sort([("_id", DESCENDING)]).limit(page.limit + 1)
+
+    projection = projection_model(query.document_model, page.fields)
+    if projection is not None:
+        query = query.project(projection)
+
+    items = await query.to_list()
+    if len(items) > page.limit:
+        items = items[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(items[-1].id)
+    return items
@@ -1,9 +1,78 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
 from passlib.context import CryptContext
 
+from app.core.config import config
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def verify_password(plain_password, hashed_password) -> bool:
+# bcrypt takes a few hundred milliseconds per call, so it runs on a bounded
+# pool instead of the event loop. The semaphore caps concurrent hashes and
+# `_pending` tracks how many calls wait for a slot or a worker.
+_executor: Optional[Executor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_pending = 0
+
+
+def _verify(plain_password, hashed_password) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password) -> str:
+
+def _hash(password) -> str:
     return pwd_context.hash(password)
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if config.PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=config.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+            )
+    return _executor
+
+
+async def _run(fn, *args):
+    global _semaphore, _pending
+    if _pending >= config.PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(503, "Too many concurrent sign-in attempts, try again later")
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(config.PASSWORD_HASH_WORKERS)
+
+    _pending += 1
+    try:
+        async with _semaphore:
+            return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await _run(_verify, plain_password, hashed_password)
+
+
+async def get_password_hash(password) -> str:
+    return await _run(_hash, password)
+
+
+def hashing_stats() -> dict:
+    """
+    Pool size, calls in progress and calls queued behind them.
+    """
+    return {
+        "workers": config.PASSWORD_HASH_WORKERS,
+        "pending": _pending,
+        "queue_depth": max(_pending - config.PASSWORD_HASH_WORKERS, 0),
+    }
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
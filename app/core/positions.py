@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from beanie.operators import In
+
+from app.core.cache import TTLCache
+from app.core.config import config
+from app.core.events import MissionChange, on_mission_change
+from app.core.tracks import invalidate_route
+from models.models import Mission, MissionStatus, Position, Step, StepStatus
+
+logger = logging.getLogger(__name__)
+
+
+async def active_missions_by_operator(
+    operators: List[PydanticObjectId],
+) -> Dict[PydanticObjectId, Tuple[Mission, Optional[Step]]]:
+    """
+    (mission, active step) of each operator's most recently started active mission.
+    """
+    missions = await Mission.find(
+        In(Mission.operator, operators), Mission.status == MissionStatus.ACTIVE
+    ).sort(-Mission.start_time).to_list()
+    if not missions:
+        return {}
+
+    steps = await Step.find(
+        In(Step.mission_id, [mission.id for mission in missions]), Step.status == StepStatus.ACTIVE
+    ).to_list()
+    step_by_mission = {step.mission_id: step for step in steps}
+
+    active: Dict[PydanticObjectId, Tuple[Mission, Optional[Step]]] = {}
+    for mission in missions:
+        if mission.operator not in active or (
+            active[mission.operator][1] is None and mission.id in step_by_mission
+        ):
+            active[mission.operator] = (mission, step_by_mission.get(mission.id))
+    return active
+
+
+async def active_steps_by_operator(
+    operators: List[PydanticObjectId],
+) -> Dict[PydanticObjectId, Tuple[PydanticObjectId, Optional[PydanticObjectId]]]:
+    """
+    (mission_id, active step id) of each operator's most recently started active mission.
+    """
+    return {
+        operator: (mission.id, step.id if step else None)
+        for operator, (mission, step) in (await active_missions_by_operator(operators)).items()
+    }
+
+
+# operator -> (mission_id, active step id), or False when no mission is active.
+# Dropped on this process's mission writes; ACTIVE_STEP_CACHE_TTL bounds how
+# long writes made by other workers go unseen.
+active_step_cache: TTLCache = TTLCache(ttl=config.ACTIVE_STEP_CACHE_TTL, maxsize=10000)
+
+
+@on_mission_change
+def _invalidate_active_step(change: MissionChange):
+    active_step_cache.invalidate(change.operator_id)
+
+
+async def tag_position(position: Position):
+    """
+    Link a fix to the mission/step its operator has active when it arrives.
+    """
+    operator = position.meta.operator
+    active = active_step_cache.get(operator)
+    if active is None:
+        active = (await active_steps_by_operator([operator])).get(operator) or False
+        active_step_cache.set(operator, active)
+    if active:
+        position.mission_id, position.step_id = active
+
+
+class PositionBuffer:
+    """
+    Collects incoming fixes in memory and writes them with one insert_many,
+    when `max_size` fixes are pending or every `interval` seconds.
+
+    Fixes are linked to their mission/step by tag_position before they are
+    added. Pending fixes are lost if the process dies; trackers resend only on
+    failed requests.
+    """
+
+    def __init__(self, max_size: int, interval: float):
+        self.max_size = max_size
+        self.interval = interval
+        self._pending: List[Position] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flushes: set = set()
+
+    def add(self, position: Position):
+        self._pending.append(position)
+        if len(self._pending) >= self.max_size:
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+
+        try:
+            await Position.insert_many(batch, ordered=False)
+            for mission_id in {position.mission_id for position in batch if position.mission_id}:
+                invalidate_route(mission_id)
+        except Exception:
+            logger.exception("Failed to store %d positions", len(batch))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+position_buffer = PositionBuffer(config.POSITION_FLUSH_SIZE, config.POSITION_FLUSH_INTERVAL)
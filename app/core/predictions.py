@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+from pymongo.asynchronous.client_session import AsyncClientSession
+
+from app.core.config import config
+from app.core.sketch import quantiles, sketch_inc
+from models.models import StepTemplate
+
+
+async def record_step_actuals(
+    step: dict, mission_start: Optional[datetime], session: Optional[AsyncClientSession] = None
+):
+    """
+    Add a closed step's start offset and duration to its template's statistics.
+    One $inc, whatever the template's history.
+    """
+    if not step.get("step_template") or not step.get("actual_start") or not step.get("actual_end"):
+        return
+
+    increments = sketch_inc("duration_stats", (step["actual_end"] - step["actual_start"]).total_seconds())
+    if mission_start:
+        increments.update(sketch_inc("start_offset_stats", (step["actual_start"] - mission_start).total_seconds()))
+    await StepTemplate.get_pymongo_collection().update_one(
+        {"_id": step["step_template"]}, {"$inc": increments}, session=session
+    )
+
+
+def _learned(stats: dict) -> Optional[float]:
+    if (stats or {}).get("count", 0) < config.TEMPLATE_PREDICTION_MIN_SAMPLES:
+        return None
+    return quantiles(stats, [config.TEMPLATE_PREDICTION_QUANTILE])[0]
+
+
+def predicted_offsets(step_template: StepTemplate) -> Tuple[Optional[float], Optional[float]]:
+    """
+    (start, end) offsets in seconds from the mission start: the learned
+    quantile of past actuals once enough steps closed, else the offsets
+    frozen when the template was created.
+    """
+    start = _learned(step_template.start_offset_stats)
+    if start is None:
+        start = step_template.start_time_offset
+
+    duration = _learned(step_template.duration_stats)
+    if duration is not None and start is not None:
+        return start, start + duration
+    end = step_template.end_time_offset
+    if start is not None and end is not None and end < start:
+        end = None
+    return start, end
@@ -0,0 +1,281 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import logging
+import pstats
+from contextvars import ContextVar
+from time import perf_counter
+from typing import List, Optional
+
+from pymongo import monitoring
+
+from app.core.config import config
+from app.core.metrics import detach_request_stats
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+
+# Commands whose plan can be explained, with the keys the driver adds that
+# the explain command does not accept.
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+SESSION_KEYS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+# Server-Timing entries per query; the header gets unwieldy beyond that.
+SERVER_TIMING_QUERIES = 20
+
+# Queries recorded per profiled request; the rest are only counted.
+MAX_TRACED_QUERIES = 1000
+
+# Responses that stream for as long as the client listens (the push stream):
+# profiling stops once their headers are sent.
+UNBOUNDED_CONTENT_TYPES = (b"text/event-stream",)
+
+
+def plan_stages(plan: dict) -> list:
+    """Flatten a winning plan into its stage names, innermost last."""
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage = f"{stage}({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return stages
+
+
+def summarize_explain(explain: dict) -> str:
+    if "queryPlanner" not in explain:
+        # Aggregations: report the $cursor stage of the first pipeline stage.
+        stage = (explain.get("stages") or [{}])[0].get("$cursor", {})
+        explain = stage or explain
+    planner = explain.get("queryPlanner", {})
+    winning = planner.get("winningPlan", {})
+    winning = winning.get("queryPlan", winning)
+    stats = explain.get("executionStats", {})
+    return (
+        f"plan={' <- '.join(plan_stages(winning)) or '?'} "
+        f"returned={stats.get('nReturned', '?')} "
+        f"keys={stats.get('totalKeysExamined', '?')} "
+        f"docs={stats.get('totalDocsExamined', '?')} "
+        f"ms={stats.get('executionTimeMillis', '?')}"
+    )
+
+
+class QueryTrace:
+    __slots__ = ("request_id", "name", "database", "collection", "command", "offset", "duration", "failed", "explain")
+
+    def __init__(self, event, offset: float):
+        self.request_id = event.request_id
+        self.name = event.command_name
+        self.database = event.database_name
+        collection = event.command.get(event.command_name)
+        self.collection = collection if isinstance(collection, str) else None
+        self.command = (
+            {key: value for key, value in event.command.items() if not key.startswith("$") and key not in SESSION_KEYS}
+            if event.command_name in EXPLAINABLE_COMMANDS else None
+        )
+        self.offset = offset
+        self.duration: Optional[float] = None
+        self.failed = False
+        self.explain: Optional[str] = None
+
+    def report(self) -> dict:
+        return {
+            "command": self.name,
+            "collection": self.collection,
+            "offset_ms": round(self.offset * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "failed": self.failed,
+            "explain": self.explain,
+        }
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.start = perf_counter()
+        self.queries: List[QueryTrace] = []
+        self.dropped_queries = 0
+        self.tracing = True
+        self.profiler: Optional[cProfile.Profile] = None
+
+    def mongo_time(self) -> float:
+        return sum(query.duration or 0.0 for query in self.queries)
+
+    def server_timing(self) -> str:
+        total = perf_counter() - self.start
+        mongo = self.mongo_time()
+        entries = [
+            f"total;dur={total * 1000:.2f}",
+            f'mongo;dur={mongo * 1000:.2f};desc="{len(self.queries)} commands"',
+            f"app;dur={max(total - mongo, 0.0) * 1000:.2f}",
+        ]
+        for i, query in enumerate(self.queries[:SERVER_TIMING_QUERIES]):
+            desc = f"{query.name} {query.collection}" if query.collection else query.name
+            entries.append(f'q{i};dur={(query.duration or 0.0) * 1000:.2f};desc="{desc}"')
+        return ", ".join(entries)
+
+
+# The profile of the request being handled, when it is profiled.
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+class QueryTracer(monitoring.CommandListener):
+    """
+    Records the commands of profiled requests. Listeners run inline in the
+    task awaiting the command, so the context is the request's.
+    """
+
+    def started(self, event):
+        profile = _current.get()
+        if profile is None or not profile.tracing:
+            return
+        if len(profile.queries) < MAX_TRACED_QUERIES:
+            profile.queries.append(QueryTrace(event, perf_counter() - profile.start))
+        else:
+            profile.dropped_queries += 1
+
+    def _finish(self, event, failed: bool):
+        profile = _current.get()
+        if profile is None:
+            return
+        for query in reversed(profile.queries):
+            if query.request_id == event.request_id:
+                query.duration = event.duration_micros / 1e6
+                query.failed = failed
+                return
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+
+query_tracer = QueryTracer()
+
+
+def wants_profile(scope) -> bool:
+    if config.PROFILE_REQUESTS:
+        return True
+    if not config.PROFILE_TOKEN:
+        return False
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return hmac.compare_digest(value, config.PROFILE_TOKEN.encode())
+    return False
+
+
+async def explain_queries(profile: RequestProfile):
+    from app.core.database import get_client
+
+    for query in profile.queries:
+        if query.command is None or query.failed:
+            continue
+        try:
+            client = get_client()
+            explain = await client[query.database].command(
+                {"explain": query.command, "verbosity": "executionStats"}
+            )
+            query.explain = summarize_explain(explain)
+        except Exception as e:
+            query.explain = f"explain failed: {e}"
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests when PROFILE_REQUESTS is set, or when they carry an
+    X-Profile header equal to PROFILE_TOKEN.
+
+    The response gets a Server-Timing header (total, MongoDB and app time,
+    one entry per query). The full report, with cProfile's top functions and
+    every query with its explain plan, is logged once the response is sent.
+    Explains run in a background task afterwards, so they count neither in
+    the request's timings nor in its metrics.
+
+    cProfile sees the whole thread: functions of requests running concurrently
+    show up too, and only one request is under cProfile at a time. Event
+    streams are profiled until their headers are sent, and at most
+    MAX_TRACED_QUERIES queries are recorded per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # The request under cProfile, if any.
+        self._profiling: Optional[RequestProfile] = None
+        self._reports: set = set()
+
+    def _stop(self, profile: RequestProfile):
+        profile.tracing = False
+        if self._profiling is profile:
+            profile.profiler.disable()
+            self._profiling = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                message = {**message, "headers": headers}
+                if any(
+                    name == b"content-type" and value.startswith(UNBOUNDED_CONTENT_TYPES)
+                    for name, value in headers
+                ):
+                    self._stop(profile)
+            await send(message)
+
+        if self._profiling is None:
+            self._profiling = profile
+            profile.profiler = cProfile.Profile()
+            profile.profiler.enable()
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self._stop(profile)
+            task = asyncio.create_task(report_profile(profile, status, perf_counter() - profile.start))
+            self._reports.add(task)
+            task.add_done_callback(self._reports.discard)
+
+
+async def report_profile(profile: RequestProfile, status: int, total: float):
+    # Tasks copy the request's context: keep the explains out of its trace and metrics.
+    _current.set(None)
+    detach_request_stats()
+    try:
+        if config.PROFILE_EXPLAIN:
+            await explain_queries(profile)
+        log_profile(profile, status, total)
+    except Exception:
+        logger.exception("Failed to report the profile of %s %s", profile.method, profile.path)
+
+
+def log_profile(profile: RequestProfile, status: int, total: float):
+    report = {
+        "method": profile.method,
+        "path": profile.path,
+        "status": status,
+        "total_ms": round(total * 1000, 3),
+        "mongo_ms": round(profile.mongo_time() * 1000, 3),
+        "queries": [query.report() for query in profile.queries],
+        "dropped_queries": profile.dropped_queries,
+    }
+    logger.info("profile %s", json.dumps(report, default=str))
+    if profile.profiler is not None:
+        output = io.StringIO()
+        pstats.Stats(profile.profiler, stream=output).sort_stats("cumulative").print_stats(config.PROFILE_TOP_FUNCTIONS)
+        logger.info("profile %s %s functions\n%s", profile.method, profile.path, output.getvalue())
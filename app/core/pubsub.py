@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Optional, Set
+
+from beanie import PydanticObjectId
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.core.config import config
+from app.core.events import MissionChange, on_mission_change
+from app.core.metrics import registry
+from models.models import MissionEvent, PushPresence
+
+logger = logging.getLogger(__name__)
+
+events_published = registry.counter(
+    "push_events_published_total", "Push events published, by backend.", ("backend",)
+)
+
+RESYNC = {"event": "resync", "mission_id": None, "data": None}
+
+
+class Broker:
+    """
+    Fans mission events out to the push subscribers of each operator.
+
+    With the memory backend an event reaches the subscribers of the process
+    that published it. With the mongo backend events are inserted into
+    MissionEvent instead, and every worker tails that collection's change
+    stream and delivers to its own subscribers. So that writes with nobody
+    listening do not cost an insert, every worker also records the operators
+    it has subscribers for in PushPresence, every `presence_interval`
+    seconds; a subscriber can miss other workers' events for that long after
+    connecting.
+    """
+
+    def __init__(self, backend: str, queue_size: int, presence_interval: float):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.presence_interval = presence_interval
+        self._subscribers: Dict[PydanticObjectId, Set[asyncio.Queue]] = defaultdict(set)
+        self._watcher: Optional[asyncio.Task] = None
+        self._presence: Optional[asyncio.Task] = None
+        self._presence_id = ObjectId()
+        self._subscribed_anywhere: Set[PydanticObjectId] = set()
+        self._inserts: set = set()
+
+    @asynccontextmanager
+    async def subscribe(self, operator: PydanticObjectId) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[operator].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[operator].discard(queue)
+            if not self._subscribers[operator]:
+                del self._subscribers[operator]
+
+    def deliver(self, operator: PydanticObjectId, message: dict):
+        for queue in self._subscribers.get(operator, ()):
+            if queue.full():
+                # A client that stopped reading: drop its backlog, it has to reload.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+            else:
+                queue.put_nowait(message)
+
+    def wants(self, operator: PydanticObjectId) -> bool:
+        """Whether an event of `operator` can reach any subscriber."""
+        return operator in self._subscribers or (self.backend == "mongo" and operator in self._subscribed_anywhere)
+
+    def publish(self, operator: PydanticObjectId, message: dict):
+        events_published.inc(self.backend)
+        if self.backend != "mongo":
+            self.deliver(operator, message)
+            return
+        task = asyncio.create_task(self._insert(operator, message))
+        self._inserts.add(task)
+        task.add_done_callback(self._inserts.discard)
+
+    async def _insert(self, operator: PydanticObjectId, message: dict):
+        try:
+            await MissionEvent(operator=operator, **message).insert()
+        except Exception:
+            logger.exception("Failed to publish %s for operator %s", message["event"], operator)
+
+    async def _watch(self):
+        collection = MissionEvent.get_pymongo_collection()
+        resume_token = None
+        while True:
+            try:
+                async with await collection.watch(
+                    [{"$match": {"operationType": "insert"}}], resume_after=resume_token
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        event = change["fullDocument"]
+                        self.deliver(event["operator"], {
+                            "event": event["event"],
+                            "mission_id": str(event["mission_id"]) if event.get("mission_id") else None,
+                            "data": event.get("data"),
+                        })
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Mission event change stream failed, reconnecting")
+                await asyncio.sleep(1)
+
+    async def _refresh_presence(self):
+        collection = PushPresence.get_pymongo_collection()
+        while True:
+            try:
+                now = datetime.utcnow()
+                await collection.update_one(
+                    {"_id": self._presence_id},
+                    {"$set": {
+                        "operators": list(self._subscribers),
+                        "expires_at": now + timedelta(seconds=3 * self.presence_interval),
+                    }},
+                    upsert=True,
+                )
+                self._subscribed_anywhere = set(
+                    await collection.distinct("operators", {"expires_at": {"$gt": now}})
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to refresh push presence")
+            await asyncio.sleep(self.presence_interval)
+
+    def start(self):
+        if self.backend == "mongo" and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+            self._presence = asyncio.create_task(self._refresh_presence())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self._presence is not None:
+            self._presence.cancel()
+            self._presence = None
+            try:
+                await PushPresence.get_pymongo_collection().delete_one({"_id": self._presence_id})
+            except Exception:
+                logger.warning("Failed to remove push presence, it expires on its own", exc_info=True)
+        if self._inserts:
+            await asyncio.gather(*self._inserts, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "operators": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "operators_subscribed_anywhere": len(self._subscribed_anywhere) if self.backend == "mongo" else None,
+        }
+
+
+broker = Broker(config.PUBSUB_BACKEND, config.PUSH_QUEUE_SIZE, config.PUSH_PRESENCE_INTERVAL)
+
+
+@on_mission_change
+def push_mission_change(change: MissionChange):
+    if not broker.wants(change.operator_id):
+        return
+    broker.publish(change.operator_id, {
+        "event": change.event,
+        "mission_id": str(change.mission_id) if change.mission_id else None,
+        "data": jsonable_encoder(change.data, custom_encoder={ObjectId: str}) if change.data else None,
+    })
@@ -0,0 +1,101 @@
+import math
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Quantiles are returned within 2% of the true value.
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Magnitudes below this (seconds) are counted as zero.
+MIN_VALUE = 1.0
+
+
+def empty_sketch() -> dict:
+    return {"count": 0, "sum": 0.0, "sum_sq": 0.0, "zero": 0, "pos": {}, "neg": {}}
+
+
+def _bucket(magnitude: float) -> str:
+    return str(math.ceil(math.log(magnitude) / LOG_GAMMA))
+
+
+def sketch_inc(field: str, value: float) -> Dict[str, float]:
+    """
+    `$inc` paths adding one value to the sketch stored under `field`.
+
+    The sketch is a logarithmic histogram (as in DDSketch): a value lands in
+    bucket ceil(log_gamma(|value|)) of the `pos` or `neg` side, so updates are
+    O(1) and the document grows with the range of values, not their number.
+    """
+    update = {f"{field}.count": 1, f"{field}.sum": value, f"{field}.sum_sq": value * value}
+    if abs(value) < MIN_VALUE:
+        update[f"{field}.zero"] = 1
+    else:
+        side = "pos" if value > 0 else "neg"
+        update[f"{field}.{side}.{_bucket(abs(value))}"] = 1
+    return update
+
+
+def add(sketch: dict, value: float) -> dict:
+    """In-memory counterpart of sketch_inc."""
+    for path, amount in sketch_inc("s", value).items():
+        target = sketch
+        *parents, leaf = path.split(".")[1:]
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = target.get(leaf, 0) + amount
+    return sketch
+
+
+def _sorted_buckets(sketch: dict):
+    """Bucket representative values in ascending order with their counts."""
+    neg = sketch.get("neg") or {}
+    pos = sketch.get("pos") or {}
+    neg_index = np.array([int(k) for k in neg], dtype=float)
+    pos_index = np.array([int(k) for k in pos], dtype=float)
+    # Bucket i covers (gamma^(i-1), gamma^i]; its midpoint in relative terms.
+    neg_values = -2 * GAMMA ** neg_index / (GAMMA + 1)
+    pos_values = 2 * GAMMA ** pos_index / (GAMMA + 1)
+
+    values = np.concatenate([neg_values, [0.0], pos_values])
+    counts = np.concatenate([
+        np.array(list(neg.values()), dtype=float),
+        [float(sketch.get("zero") or 0)],
+        np.array(list(pos.values()), dtype=float),
+    ])
+    order = np.argsort(values)
+    return values[order], counts[order]
+
+
+def quantiles(sketch: Optional[dict], qs: Iterable[float]) -> List[Optional[float]]:
+    qs = list(qs)
+    if not sketch or not sketch.get("count"):
+        return [None] * len(qs)
+    values, counts = _sorted_buckets(sketch)
+    cumulative = np.cumsum(counts)
+    ranks = np.asarray(qs, dtype=float) * (cumulative[-1] - 1)
+    indexes = np.searchsorted(cumulative, ranks, side="right")
+    return [round(float(v), 1) for v in values[np.minimum(indexes, len(values) - 1)]]
+
+
+def mean(sketch: Optional[dict]) -> Optional[float]:
+    if not sketch or not sketch.get("count"):
+        return None
+    return sketch["sum"] / sketch["count"]
+
+
+def stddev(sketch: Optional[dict]) -> Optional[float]:
+    if not sketch or not sketch.get("count"):
+        return None
+    average = sketch["sum"] / sketch["count"]
+    return math.sqrt(max(sketch["sum_sq"] / sketch["count"] - average * average, 0.0))
+
+
+def summarize(sketch: Optional[dict], qs: Iterable[float]) -> dict:
+    qs = list(qs)
+    return {
+        "count": (sketch or {}).get("count", 0),
+        "mean": mean(sketch),
+        "stddev": stddev(sketch),
+        "percentiles": dict(zip((f"p{round(q * 100):g}" for q in qs), quantiles(sketch, qs))),
+    }
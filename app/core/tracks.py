@@ -0,0 +1,190 @@
+import asyncio
+import json
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+from beanie import PydanticObjectId
+
+from app.core.cache import TTLCache
+from app.core.config import config
+from app.core.events import on_mission_complete
+from app.core.geo import decode_deltas, decode_polyline, encode_deltas, encode_polyline
+from models.models import Position, Track, TrackSource
+
+# (mission_id, step_id, tolerance, format) -> simplified route response.
+route_cache: TTLCache[dict] = TTLCache(ttl=config.ROUTE_CACHE_TTL, maxsize=512)
+
+
+class TrackParseError(ValueError):
+    pass
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_gpx(file: BinaryIO) -> Tuple[np.ndarray, List[Optional[datetime]]]:
+    """
+    Track and route points of a GPX file, parsed incrementally.
+    """
+    points, times = [], []
+    try:
+        for _, element in ET.iterparse(file, events=("end",)):
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag in ("trkpt", "rtept"):
+                points.append((float(element.attrib["lat"]), float(element.attrib["lon"])))
+                time = next((child.text for child in element if child.tag.rsplit("}", 1)[-1] == "time"), None)
+                times.append(_parse_time(time))
+                element.clear()
+    except (ET.ParseError, KeyError, ValueError) as e:
+        raise TrackParseError(f"Invalid GPX: {e}")
+    return np.array(points, dtype=float).reshape(-1, 2), times
+
+
+def parse_geojson(file: BinaryIO) -> Tuple[np.ndarray, List[Optional[datetime]]]:
+    """
+    LineString / MultiLineString geometries of a GeoJSON document. Per-point
+    times are read from the `coordTimes` property (as written by togeojson).
+    """
+    points, times = [], []
+    try:
+        document = json.load(file)
+        if document.get("type") == "FeatureCollection":
+            features = document.get("features") or []
+        elif document.get("type") == "Feature":
+            features = [document]
+        else:
+            features = [{"geometry": document, "properties": {}}]
+
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            lines = geometry.get("coordinates") or []
+            if geometry.get("type") == "LineString":
+                lines = [lines]
+            elif geometry.get("type") != "MultiLineString":
+                continue
+            coord_times = (feature.get("properties") or {}).get("coordTimes") or []
+            if coord_times and isinstance(coord_times[0], str):
+                coord_times = [coord_times]
+            for i, line in enumerate(lines):
+                line_times = coord_times[i] if i < len(coord_times) else []
+                for j, coordinate in enumerate(line):
+                    points.append((float(coordinate[1]), float(coordinate[0])))
+                    times.append(_parse_time(line_times[j]) if j < len(line_times) else None)
+    # Documents of the wrong shape: not objects, short or non-numeric coordinates, bad times.
+    except (ValueError, TypeError, AttributeError, IndexError, KeyError) as e:
+        raise TrackParseError(f"Invalid GeoJSON: {e}")
+    return np.array(points, dtype=float).reshape(-1, 2), times
+
+
+def parse_track_file(filename: str, file: BinaryIO) -> Tuple[np.ndarray, List[Optional[datetime]]]:
+    name = (filename or "").lower()
+    if name.endswith(".gpx"):
+        return parse_gpx(file)
+    if name.endswith((".geojson", ".json")):
+        return parse_geojson(file)
+    raise TrackParseError("Unsupported track format, upload a .gpx or .geojson file")
+
+
+def build_track(
+    mission_id: PydanticObjectId,
+    points: np.ndarray,
+    times: List[Optional[datetime]],
+    step_id: Optional[PydanticObjectId] = None,
+    source: TrackSource = TrackSource.UPLOAD,
+    name: Optional[str] = None,
+) -> Track:
+    start_time = time_deltas = None
+    if times and all(times):
+        start_time = times[0]
+        time_deltas = encode_deltas(int((time - start_time).total_seconds()) for time in times)
+    return Track(
+        mission_id=mission_id,
+        step_id=step_id,
+        source=source,
+        name=name,
+        point_count=len(points),
+        polyline=encode_polyline(points),
+        start_time=start_time,
+        time_deltas=time_deltas,
+    )
+
+
+def track_times(track: Track) -> List[int]:
+    """Fix times of a track as seconds since its start_time."""
+    return decode_deltas(track.time_deltas)
+
+
+def invalidate_route(mission_id: PydanticObjectId):
+    route_cache.invalidate_where(lambda key, _: key[0] == mission_id)
+
+
+async def route_segments(
+    mission_id: PydanticObjectId, step_id: Optional[PydanticObjectId] = None
+) -> List[Tuple[Track, np.ndarray]]:
+    """
+    Decoded tracks of a mission (or step). Until the GPS fixes of a mission are
+    archived, they are read live from the Position collection.
+    """
+    filters = {"mission_id": mission_id}
+    if step_id:
+        filters["step_id"] = step_id
+    tracks = await Track.find(filters).to_list()
+    segments = [(track, decode_polyline(track.polyline)) for track in tracks]
+
+    if not any(track.source == TrackSource.GPS for track in tracks):
+        cursor = Position.get_pymongo_collection().find(
+            filters, {"coordinates": 1, "_id": 0}
+        ).sort("timestamp", 1)
+        fixes = [(p["coordinates"]["lat"], p["coordinates"]["lon"]) async for p in cursor]
+        if fixes:
+            live = Track(
+                mission_id=mission_id, step_id=step_id, source=TrackSource.GPS,
+                point_count=len(fixes), polyline="",
+            )
+            segments.append((live, np.array(fixes, dtype=float)))
+    return segments
+
+
+@on_mission_complete
+async def archive_mission_track(mission_id: PydanticObjectId):
+    """
+    Encode the GPS fixes of a completed mission into one Track per step.
+
+    Fixes still buffered are flushed first: this process's right away, other
+    workers' within POSITION_FLUSH_INTERVAL, which is waited out. The raw
+    fixes then expire with the Position collection's retention.
+    """
+    # Imported here, positions imports this module for invalidate_route.
+    from app.core.positions import position_buffer
+
+    await position_buffer.flush()
+    await asyncio.sleep(config.POSITION_FLUSH_INTERVAL)
+
+    if await Track.find_one({"mission_id": mission_id, "source": TrackSource.GPS.value}):
+        return
+
+    cursor = Position.get_pymongo_collection().find(
+        {"mission_id": mission_id}, {"coordinates": 1, "timestamp": 1, "step_id": 1, "_id": 0}
+    ).sort("timestamp", 1)
+
+    by_step = {}
+    async for fix in cursor:
+        points, times = by_step.setdefault(fix.get("step_id"), ([], []))
+        points.append((fix["coordinates"]["lat"], fix["coordinates"]["lon"]))
+        times.append(fix["timestamp"])
+
+    tracks = [
+        build_track(mission_id, np.array(points, dtype=float), times, step_id=step_id, source=TrackSource.GPS)
+        for step_id, (points, times) in by_step.items()
+    ]
+    if tracks:
+        await Track.insert_many(tracks)
+        invalidate_route(mission_id)
@@ -1,34 +1,87 @@
 from datetime import time
+import hmac
+import logging
 import os
 from asyncio import run
 from beanie import init_beanie
 from contextlib import asynccontextmanager
-from fastapi import Depends, FastAPI, APIRouter, HTTPException
+from typing import Optional
+from fastapi import Depends, FastAPI, APIRouter, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.database import db
+from fastapi.responses import PlainTextResponse
+from app.core import database
 from app.core.config import config
 from api.router import router as api_router
-from app.core.email import send_email
-from app.core.jwt import FastJWT
-from models.models import StepTemplate, User, Mission, Step, Location, Note, MissionTemplate
+from app.core.email import email_outbox
+from app.core.indexes import check_indexes
+from app.core.jwt import FastJWT, invalidate_user_tokens
+from app.core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry
+from app.core.migrations import (
+    migrate_duplicate_location_names,
+    migrate_duplicate_step_orders,
+    migrate_location_coordinates,
+    migrate_note_operators,
+    migrate_position_retention,
+    migrate_template_counters,
+)
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.profiling import ProfilingMiddleware
+from app.core.password_utils import hashing_stats, shutdown_executor
+from app.core.positions import position_buffer
+from app.core.pubsub import broker
+from models.models import User, document_models
+
+logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    db = database.connect()
+
+    migrated = await migrate_location_coordinates(db)
+    if migrated:
+        logger.info("Converted %d location(s) to GeoJSON", migrated)
+    if await migrate_position_retention(db):
+        logger.info("Set the Position retention")
+    backfilled = await migrate_note_operators(db)
+    if backfilled:
+        logger.info("Set the operator of %d note(s) from their mission", backfilled)
+    dropped = await migrate_template_counters(db)
+    if dropped:
+        logger.info("Dropped %d template counter(s) keyed by template id", dropped)
+    # Unique indexes cannot be built over duplicates.
+    renamed = await migrate_duplicate_location_names(db)
+    if renamed:
+        logger.warning("Renamed %d location(s) sharing a name with an older one", renamed)
+    renumbered = await migrate_duplicate_step_orders(db)
+    if renumbered:
+        logger.warning("Renumbered the steps of %d mission(s) with duplicate step orders", renumbered)
+
     await init_beanie(
         database=db,
-        document_models=[
-            User,
-            Mission,
-            Step,
-            Note,
-            Location,
-            MissionTemplate,
-            StepTemplate,
-        ],
+        document_models=document_models,
     )
 
+    if config.CHECK_INDEXES_ON_STARTUP:
+        try:
+            for line in await check_indexes(document_models):
+                logger.warning("Index check: %s", line)
+        except Exception:
+            # The report is advisory, never block startup on it.
+            logger.exception("Index check failed")
+
+    position_buffer.start()
+    broker.start()
+    email_outbox.start()
+
     yield
 
+    await email_outbox.stop()
+    await broker.stop()
+    await position_buffer.stop()
+    shutdown_executor()
+    await database.close()
+
 
 def get_application():
     _app = FastAPI(title=config.PROJECT_NAME, lifespan=lifespan)
@@ -39,20 +92,61 @@ def get_application():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "Server-Timing"],
     )
+    if config.PROFILE_REQUESTS or config.PROFILE_TOKEN:
+        _app.add_middleware(ProfilingMiddleware)
+    if config.METRICS_ENABLED:
+        _app.add_middleware(MetricsMiddleware)
 
     return _app
 
 
 app = get_application()
 
+def internal_access(authorization: Optional[str]) -> bool:
+    """Whether a request may read metrics and process internals: `Bearer <METRICS_TOKEN>`."""
+    if not config.METRICS_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), config.METRICS_TOKEN.encode())
+
+
 # health check
 @app.get("/health")
-async def health():   
-    return {"status": "ok"}
+async def health(authorization: Optional[str] = Header(None)):
+    if not internal_access(authorization):
+        return {"status": "ok"}
+    return {
+        "status": "ok",
+        "password_hashing": hashing_stats(),
+        "push": broker.stats(),
+        "database_pool": database.pool_stats(),
+    }
     
 
 
+@app.get("/ready")
+async def ready(response: Response):
+    """
+    Readiness for load balancers: 503 while the database does not answer a
+    ping in time. Unlike /health, which only tells the process is up.
+    """
+    result = await database.readiness.check()
+    if not result["ready"]:
+        response.status_code = 503
+    return result
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    if not config.METRICS_ENABLED or not config.METRICS_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if not internal_access(authorization):
+        raise HTTPException(401, "Unauthorized")
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/verify")
 async def verify_email_event(email: str, token: str):
     decoded_token = await FastJWT().decode(token)
@@ -68,6 +162,7 @@ async def verify_email_event(email: str, token: str):
     
     user.email_verified = True
     await user.save()
+    invalidate_user_tokens(user.id)
     
     return {"message": "Email verified successfully"}
 
@@ -3,11 +3,12 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any, Tuple
 from uuid import uuid4
 
-from beanie import Document, Indexed, Link, PydanticObjectId
-from pydantic import BaseModel, Field, validator
+from beanie import Document, Granularity, Indexed, Link, PydanticObjectId, TimeSeriesConfig
+from pydantic import BaseModel, Field, field_validator, model_validator, validator
+from pymongo import ASCENDING, GEOSPHERE, TEXT, IndexModel
 
 
 class User(Document):
@@ -15,6 +16,20 @@ class User(Document):
     password: str
     email: Optional[str] = None
     email_verified: bool = False
+    # SHA-256 of the key of the user's Traccar server position forwarding (forward.url).
+    forward_secret_hash: Optional[str] = None
+
+    class Settings:
+        indexes = [
+            IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+            # Users without an email must not collide on null.
+            IndexModel(
+                [("email", ASCENDING)],
+                name="email_unique",
+                unique=True,
+                partialFilterExpression={"email": {"$type": "string"}},
+            ),
+        ]
 
 
 class MissionStatus(str, Enum):
@@ -50,10 +65,52 @@ class GeoPoint(BaseModel):
     lon: float
 
 
+class GeoJSONPoint(BaseModel):
+    """
+    GeoJSON Point, `coordinates` as [lon, lat]. The legacy {lat, lon} shape is
+    accepted on input.
+    """
+    type: Literal["Point"] = "Point"
+    coordinates: Tuple[float, float]
+
+    @model_validator(mode="before")
+    @classmethod
+    def from_lat_lon(cls, data: Any) -> Any:
+        if isinstance(data, dict) and "coordinates" not in data and {"lat", "lon"} <= data.keys():
+            return {"type": "Point", "coordinates": (data["lon"], data["lat"])}
+        if isinstance(data, GeoPoint):
+            return {"type": "Point", "coordinates": (data.lon, data.lat)}
+        return data
+
+    @field_validator("coordinates")
+    @classmethod
+    def check_range(cls, value: Tuple[float, float]) -> Tuple[float, float]:
+        lon, lat = value
+        if not -180 <= lon <= 180 or not -90 <= lat <= 90:
+            raise ValueError("coordinates must be [lon, lat] within [-180, 180] and [-90, 90]")
+        return value
+
+    @property
+    def lon(self) -> float:
+        return self.coordinates[0]
+
+    @property
+    def lat(self) -> float:
+        return self.coordinates[1]
+
+
 class Location(Document):
     name: str
     location_type: LocationType = LocationType.GENERIC
-    coordinates: GeoPoint
+    coordinates: GeoJSONPoint
+    # Geofence radius in meters, used to detect arrival at / departure from the location.
+    radius: float = 50.0
+
+    class Settings:
+        indexes = [
+            IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+            IndexModel([("coordinates", GEOSPHERE)], name="coordinates_2dsphere"),
+        ]
 
 
 class Note(Document):
@@ -62,7 +119,26 @@ class Note(Document):
     """
     mission_id: PydanticObjectId
     step_id: Optional[PydanticObjectId] = None
+    operator: PydanticObjectId
     content: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        indexes = [
+            IndexModel([("mission_id", ASCENDING), ("step_id", ASCENDING)], name="mission_step"),
+            # Searches are per operator: the equality prefix keeps them within one user's notes.
+            IndexModel([("operator", ASCENDING), ("content", TEXT)], name="operator_content_text"),
+        ]
+
+
+class CalendarSource(BaseModel):
+    """
+    Origin of a mission or step imported from an iCalendar file.
+    """
+    feed: str
+    uid: str
+    # Hash of the imported event fields; re-imports skip unchanged events.
+    hash: str
 
 
 class Step(Document):
@@ -82,6 +158,21 @@ class Step(Document):
 
     location: Optional[PydanticObjectId] = None
 
+    calendar: Optional[CalendarSource] = None
+    # Set on steps instantiated from a template; their actuals feed its statistics.
+    step_template: Optional[PydanticObjectId] = None
+
+    class Settings:
+        indexes = [
+            # Steps are listed and progressed in order; one step per slot.
+            IndexModel([("mission_id", ASCENDING), ("order", ASCENDING)], name="mission_order_unique", unique=True),
+            # Active-step lookups (dashboard, proceed).
+            IndexModel(
+                [("mission_id", ASCENDING), ("status", ASCENDING), ("order", ASCENDING)],
+                name="mission_status_order",
+            ),
+        ]
+
 class MissionTemplate(Document):
     name: str
 
@@ -98,6 +189,32 @@ class Mission(Document):
     summary: Optional[str] = None
     tags: Optional[list] = []
 
+    # Set when the mission was instantiated from a template: the template and
+    # the instance number used for the name suffix.
+    mission_template: Optional[PydanticObjectId] = None
+    sequence: Optional[int] = None
+
+    # Bumped by every step progression; proceed requests claim it atomically.
+    progress_version: int = 0
+
+    calendar: Optional[CalendarSource] = None
+
+    # Set once the completed mission is counted in AnalyticsSummary.
+    analyzed: bool = False
+
+    class Settings:
+        indexes = [
+            IndexModel([("operator", ASCENDING), ("status", ASCENDING)], name="operator_status"),
+            IndexModel([("operator", ASCENDING), ("name", ASCENDING)], name="operator_name"),
+            # One mission per calendar event; also serves the import diff.
+            IndexModel(
+                [("operator", ASCENDING), ("calendar.feed", ASCENDING), ("calendar.uid", ASCENDING)],
+                name="operator_calendar_uid",
+                unique=True,
+                partialFilterExpression={"calendar.uid": {"$exists": True}},
+            ),
+        ]
+
 
 class MissionTemplate(Document):
     name: str
@@ -113,4 +230,262 @@ class StepTemplate(Document):
     end_time_offset: Optional[float] = None
 
     step_type: StepType = StepType.CUSTOM
-    location: Optional[PydanticObjectId] = None 
\ No newline at end of file
+    location: Optional[PydanticObjectId] = None
+
+    # Actuals of the steps instantiated from this template, in seconds, as
+    # sketches (see app.core.sketch) updated as each of those steps closes.
+    start_offset_stats: Dict[str, Any] = Field(default_factory=dict)
+    duration_stats: Dict[str, Any] = Field(default_factory=dict)
+
+    class Settings:
+        indexes = [
+            IndexModel([("mission_template", ASCENDING), ("order", ASCENDING)], name="mission_template_order"),
+        ]
+
+
+class TemplateCounter(Document):
+    """
+    Number of missions an operator named after a template, advanced with $inc.
+    Keyed by template name, not id: templates are global and their names are
+    not unique, while mission names are unique per operator.
+    """
+    operator: PydanticObjectId
+    template_name: str
+    sequence: int = 0
+
+    class Settings:
+        indexes = [
+            IndexModel(
+                [("operator", ASCENDING), ("template_name", ASCENDING)],
+                name="operator_template_name_unique",
+                unique=True,
+            ),
+        ]
+
+
+class Device(Document):
+    """
+    GPS tracker (Traccar server or OsmAnd-protocol client) reporting for an operator.
+    """
+    unique_id: str
+    operator: PydanticObjectId
+    name: Optional[str] = None
+    # SHA-256 of the key the tracker sends; only authenticated fixes drive geofences.
+    secret_hash: Optional[str] = None
+
+    class Settings:
+        indexes = [
+            IndexModel([("unique_id", ASCENDING)], name="unique_id_unique", unique=True),
+            IndexModel([("operator", ASCENDING)], name="operator"),
+        ]
+
+
+class PositionMeta(BaseModel):
+    device_id: str
+    operator: PydanticObjectId
+
+
+# Raw fixes are dropped after this; completed missions keep them as Tracks.
+POSITION_RETENTION_SECONDS = 30 * 24 * 3600
+
+
+class Position(Document):
+    """
+    One GPS fix, stored in a time-series collection bucketed by device.
+    Expires after POSITION_RETENTION_SECONDS.
+    """
+    timestamp: datetime
+    meta: PositionMeta
+    coordinates: GeoPoint
+
+    # Units as reported by Traccar: knots, degrees, meters, percent.
+    speed: Optional[float] = None
+    bearing: Optional[float] = None
+    altitude: Optional[float] = None
+    accuracy: Optional[float] = None
+    battery: Optional[float] = None
+
+    # Active mission/step of the operator when the fix was stored.
+    mission_id: Optional[PydanticObjectId] = None
+    step_id: Optional[PydanticObjectId] = None
+
+    class Settings:
+        timeseries = TimeSeriesConfig(
+            time_field="timestamp",
+            meta_field="meta",
+            granularity=Granularity.seconds,
+            expire_after_seconds=POSITION_RETENTION_SECONDS,
+        )
+        indexes = [
+            IndexModel([("meta.operator", ASCENDING), ("timestamp", ASCENDING)], name="operator_timestamp"),
+            IndexModel([("mission_id", ASCENDING), ("timestamp", ASCENDING)], name="mission_timestamp"),
+        ]
+
+
+class TrackSource(str, Enum):
+    UPLOAD = "upload"
+    GPS = "gps"
+
+
+class Track(Document):
+    """
+    Route of a mission (or one of its steps), uploaded as GPX/GeoJSON or
+    archived from the GPS fixes when the mission completes. Stored encoded.
+    """
+    mission_id: PydanticObjectId
+    step_id: Optional[PydanticObjectId] = None
+    source: TrackSource = TrackSource.UPLOAD
+    name: Optional[str] = None
+
+    point_count: int
+    # Google encoded polyline, 1e-5 degree precision.
+    polyline: str
+    # Fix times as zigzag varint deltas in seconds since start_time, when known.
+    start_time: Optional[datetime] = None
+    time_deltas: Optional[bytes] = None
+
+    class Settings:
+        indexes = [
+            IndexModel([("mission_id", ASCENDING), ("step_id", ASCENDING)], name="mission_step"),
+        ]
+
+
+class AnalyticsDimension(str, Enum):
+    OVERALL = "overall"
+    TEMPLATE = "template"
+    STEP_TYPE = "step_type"
+
+
+class AnalyticsSummary(Document):
+    """
+    After-action statistics of an operator's completed missions, for all
+    missions, per mission template or per step type. Updated with $inc as
+    missions complete; times are sketches of seconds (see app.core.sketch).
+    """
+    operator: PydanticObjectId
+    dimension: AnalyticsDimension
+    key: str
+
+    missions: int = 0
+    steps: int = 0
+    # Steps started within ANALYTICS_ON_TIME_TOLERANCE of planned_start, or before / after it.
+    on_time: int = 0
+    early: int = 0
+    late: int = 0
+
+    start_delay: Dict[str, Any] = Field(default_factory=dict)
+    duration: Dict[str, Any] = Field(default_factory=dict)
+    # Actual minus planned step duration.
+    overrun: Dict[str, Any] = Field(default_factory=dict)
+    mission_duration: Dict[str, Any] = Field(default_factory=dict)
+
+    updated_at: Optional[datetime] = None
+
+    class Settings:
+        indexes = [
+            IndexModel(
+                [("operator", ASCENDING), ("dimension", ASCENDING), ("key", ASCENDING)],
+                name="operator_dimension_key",
+                unique=True,
+            ),
+        ]
+
+
+class CalendarFeedVersion(Document):
+    """
+    Version of an operator's calendar feed (id = operator id), incremented on
+    every mission/step write. Shared by all workers, so ETags are stable.
+    """
+    version: int = 0
+    modified: datetime = Field(default_factory=datetime.utcnow)
+
+
+class PushPresence(Document):
+    """
+    Operators with push subscribers on one worker (PUBSUB_BACKEND=mongo),
+    refreshed by that worker and expiring when it stops refreshing.
+    """
+    operators: List[PydanticObjectId] = []
+    expires_at: datetime
+
+    class Settings:
+        indexes = [
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ]
+
+
+class MissionEvent(Document):
+    """
+    Mission/step change fanned out to every worker through a change stream
+    (PUBSUB_BACKEND=mongo). Expires after an hour.
+    """
+    operator: PydanticObjectId
+    mission_id: Optional[PydanticObjectId] = None
+    event: str
+    data: Optional[Dict[str, Any]] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        indexes = [
+            IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=3600),
+        ]
+
+
+class OutboxStatus(str, Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class OutboxEmail(Document):
+    """
+    Email queued by a request and sent by the outbox worker of any process.
+    A SENDING email whose lease expired (its worker died) is picked up again.
+    Sent emails expire after a week.
+    """
+    to: str
+    domain: str
+    subject: str
+    body: str
+    sender: Optional[str] = None
+
+    status: OutboxStatus = OutboxStatus.PENDING
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    locked_until: Optional[datetime] = None
+    claim: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
+
+    class Settings:
+        indexes = [
+            IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+            IndexModel([("claim", ASCENDING)], name="claim", sparse=True),
+            IndexModel(
+                [("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=7 * 24 * 3600,
+                partialFilterExpression={"status": OutboxStatus.SENT.value},
+            ),
+        ]
+
+
+# Registered with init_beanie on startup and by the scripts.
+document_models = [
+    User,
+    Mission,
+    Step,
+    Note,
+    Location,
+    MissionTemplate,
+    StepTemplate,
+    TemplateCounter,
+    Device,
+    Position,
+    Track,
+    AnalyticsSummary,
+    CalendarFeedVersion,
+    PushPresence,
+    MissionEvent,
+    OutboxEmail,
+]
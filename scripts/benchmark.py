@@ -0,0 +1,307 @@
+"""
+Load-test the API against a generated dataset and keep the results per commit.
+
+The dataset is written to its own database (`<DATABASE_NAME>_bench` unless
+--database is given) and the app is driven in-process through httpx's ASGI
+transport, or over HTTP with --base-url against a running server that uses
+the same database.
+
+    python -m scripts.benchmark --users 1000 --missions 100 --steps 10
+    python -m scripts.benchmark --skip-seed --requests 500 --concurrency 32
+
+Every run appends one JSON line to --results and prints the p95 change
+against the last run recorded for a different commit.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+ROUTES = ["dashboard", "get_mission", "proceed", "from_template"]
+REGRESSION_THRESHOLD = 0.2
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", help="database to seed and benchmark (default: <DATABASE_NAME>_bench)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--missions", type=int, default=100, help="missions per user")
+    parser.add_argument("--steps", type=int, default=10, help="steps per mission and per template")
+    parser.add_argument("--templates", type=int, default=50)
+    parser.add_argument("--locations", type=int, default=500)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the dataset of a previous run")
+    parser.add_argument("--requests", type=int, default=300, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--results", default="benchmarks/results.jsonl")
+    return parser.parse_args()
+
+
+def _batches(items: List[dict], size: int = 10000):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def seed(db, args: argparse.Namespace):
+    """
+    Write users, locations, templates, missions and steps with insert_many.
+
+    Missions are a mix of completed (all steps done, with actual times),
+    active (some steps done, one active) and planned ones.
+    """
+    from bson import ObjectId
+    from app.core.password_utils import pwd_context
+
+    for name in ["User", "Location", "MissionTemplate", "StepTemplate", "Mission", "Step", "TemplateCounter"]:
+        await db[name].delete_many({})
+
+    started = time.perf_counter()
+    password = pwd_context.hash("benchmark")
+    now = datetime.utcnow()
+
+    users = [{"_id": ObjectId(), "username": f"bench-{i}", "password": password, "email_verified": False} for i in range(args.users)]
+    locations = [
+        {
+            "_id": ObjectId(),
+            "name": f"Location {i}",
+            "location_type": "generic",
+            "coordinates": {"type": "Point", "coordinates": [random.uniform(-3.0, 1.0), random.uniform(50.0, 53.0)]},
+        }
+        for i in range(args.locations)
+    ]
+    await db["User"].insert_many(users)
+    await db["Location"].insert_many(locations)
+
+    templates = [{"_id": ObjectId(), "name": f"Template {i}", "tags": []} for i in range(args.templates)]
+    step_templates = [
+        {
+            "_id": ObjectId(),
+            "name": f"Step {order}",
+            "order": order,
+            "mission_template": template["_id"],
+            "start_time_offset": (order - 1) * 600.0,
+            "end_time_offset": order * 600.0,
+            "step_type": random.choice(["movement", "activity", "waiting"]),
+            "location": random.choice(locations)["_id"] if locations else None,
+        }
+        for template in templates
+        for order in range(1, args.steps + 1)
+    ]
+    if templates:
+        await db["MissionTemplate"].insert_many(templates)
+        await db["StepTemplate"].insert_many(step_templates)
+
+    for user in users:
+        missions, steps = [], []
+        for m in range(args.missions):
+            start = now - timedelta(days=random.randint(0, 3 * 365), minutes=random.randint(0, 1440))
+            state = random.choices(["completed", "active", "planned"], weights=[80, 5, 15])[0]
+            mission_id = ObjectId()
+            missions.append({
+                "_id": mission_id,
+                "name": f"Mission {m}",
+                "operator": user["_id"],
+                "start_time": start if state != "planned" else None,
+                "end_time": start + timedelta(minutes=10 * args.steps) if state == "completed" else None,
+                "status": state,
+                "tags": [],
+                "progress_version": 0,
+            })
+            active_order = random.randint(1, args.steps) if state == "active" else None
+            for order in range(1, args.steps + 1):
+                planned_start = start + timedelta(minutes=10 * (order - 1))
+                delay = timedelta(seconds=random.gauss(60, 120))
+                if state == "completed" or (active_order and order < active_order):
+                    status, actual_start, actual_end = "done", planned_start + delay, planned_start + delay + timedelta(minutes=10)
+                elif order == active_order:
+                    status, actual_start, actual_end = "active", planned_start + delay, None
+                else:
+                    status, actual_start, actual_end = "planned", None, None
+                steps.append({
+                    "_id": ObjectId(),
+                    "order": order,
+                    "name": f"Step {order}",
+                    "mission_id": mission_id,
+                    "step_type": random.choice(["movement", "activity", "waiting"]),
+                    "planned_start": planned_start,
+                    "planned_end": planned_start + timedelta(minutes=10),
+                    "actual_start": actual_start,
+                    "actual_end": actual_end,
+                    "status": status,
+                    "location": random.choice(locations)["_id"] if locations else None,
+                })
+        for batch in _batches(missions):
+            await db["Mission"].insert_many(batch, ordered=False)
+        for batch in _batches(steps):
+            await db["Step"].insert_many(batch, ordered=False)
+
+    print(
+        f"seeded {len(users)} users, {len(users) * args.missions} missions, "
+        f"{len(users) * args.missions * args.steps} steps in {time.perf_counter() - started:.1f}s"
+    )
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_route(name: str, make_request: Callable[[int], Awaitable], total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors: Dict[int, int] = {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            response = await make_request(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "errors": errors,
+    }
+    print(
+        f"{name:<15} {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+        f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {errors or '-'}"
+    )
+    return result
+
+
+async def benchmark(db, args: argparse.Namespace, client) -> dict:
+    from app.core.jwt import FastJWT
+
+    users = await db["User"].find({}, {"username": 1}).limit(200).to_list()
+    if not users:
+        raise SystemExit("no users in the benchmark database, run without --skip-seed first")
+    tokens = {
+        user["_id"]: await FastJWT().encode(optional_data={"id": str(user["_id"]), "username": user["username"]})
+        for user in users
+    }
+    operators = list(tokens)
+
+    missions = await db["Mission"].find({"operator": {"$in": operators}}, {"operator": 1, "status": 1}).to_list()
+    open_missions = [m for m in missions if m["status"] in ("planned", "active")]
+    random.shuffle(open_missions)
+    templates = [t["_id"] for t in await db["MissionTemplate"].find({}, {"_id": 1}).to_list()]
+
+    def headers(operator):
+        return {"Authorization": tokens[operator]}
+
+    def dashboard(i):
+        operator = operators[i % len(operators)]
+        return client.get("/api/private/dashboard/", headers=headers(operator))
+
+    def get_mission(i):
+        mission = missions[i % len(missions)]
+        return client.get(
+            f"/api/private/mission/{mission['_id']}",
+            params={"include_steps": "true", "include_locations": "true"},
+            headers=headers(mission["operator"]),
+        )
+
+    def proceed(i):
+        # Distinct missions, so concurrent requests do not contend for the same one.
+        mission = open_missions[i % len(open_missions)]
+        return client.post(f"/api/private/step/proceed/{mission['_id']}", headers=headers(mission["operator"]))
+
+    def from_template(i):
+        operator = operators[i % len(operators)]
+        return client.post(f"/api/private/mission/{templates[i % len(templates)]}/from_template", headers=headers(operator))
+
+    requests = {"dashboard": dashboard, "get_mission": get_mission, "proceed": proceed, "from_template": from_template}
+    results = {}
+    for name in args.routes.split(","):
+        if (name == "proceed" and not open_missions) or (name == "from_template" and not templates):
+            print(f"{name:<15} skipped, no data")
+            continue
+        results[name] = await run_route(name, requests[name], args.requests, args.concurrency)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record(results: dict, args: argparse.Namespace):
+    path = Path(args.results)
+    previous = None
+    commit = _git_commit()
+    if path.exists():
+        for line in path.read_text().splitlines():
+            entry = json.loads(line)
+            if entry.get("commit") != commit:
+                previous = entry
+
+    entry = {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(),
+        "dataset": {k: getattr(args, k) for k in ["users", "missions", "steps", "templates", "locations"]},
+        "concurrency": args.concurrency,
+        "routes": results,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+    if previous:
+        print(f"\np95 against {previous['commit']}:")
+        for name, result in results.items():
+            before = previous["routes"].get(name)
+            if not before or not before["p95_ms"]:
+                continue
+            change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+            flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+            print(f"{name:<15} {before['p95_ms']:>8} -> {result['p95_ms']:>8} ms ({change:+.0%}){flag}")
+
+
+async def main():
+    args = parse_args()
+
+    # Must happen before the app connects, the database name is read in connect().
+    from app.core.config import config
+    config.DATABASE_NAME = args.database or f"{config.DATABASE_NAME}_bench"
+
+    import httpx
+    from app.core.database import connect
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        db = connect()
+        if not args.skip_seed:
+            await seed(db, args)
+
+        if args.base_url:
+            client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+        else:
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60)
+        async with client:
+            results = await benchmark(db, args, client)
+
+    record(results, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
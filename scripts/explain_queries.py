@@ -0,0 +1,160 @@
+"""
+Print explain-plan summaries for the query shapes issued by the API routes.
+
+Run against a populated database (see scripts/populate_db.py):
+
+    python -m scripts.explain_queries
+"""
+import asyncio
+
+from beanie import PydanticObjectId, init_beanie
+
+from app.core.database import close, connect
+from app.core.profiling import summarize_explain
+from api.dashboard import active_missions_pipeline
+from api.location import bbox_polygon
+from models.models import (
+    AnalyticsSummary,
+    CalendarFeedVersion,
+    Device,
+    Location,
+    Mission,
+    MissionTemplate,
+    Note,
+    Position,
+    Step,
+    StepTemplate,
+    TemplateCounter,
+    Track,
+    User,
+    document_models,
+)
+
+
+async def explain_find(label: str, model, filter: dict, sort=None):
+    command = {"find": model.get_collection_name(), "filter": filter}
+    if sort:
+        command["sort"] = dict(sort)
+    explain = await connect().command({"explain": command, "verbosity": "executionStats"})
+    print(f"{label:<45} {summarize_explain(explain)}")
+
+
+async def explain_aggregate(label: str, model, pipeline: list):
+    command = {"aggregate": model.get_collection_name(), "pipeline": pipeline, "cursor": {}}
+    explain = await connect().command({"explain": command, "verbosity": "executionStats"})
+    print(f"{label:<45} {summarize_explain(explain)}")
+
+
+async def main():
+    await init_beanie(database=connect(), document_models=document_models)
+
+    user = await User.find_one({}) or User(id=PydanticObjectId(), username="ihor", password="")
+    mission = await Mission.find_one({"operator": user.id}) or Mission(id=PydanticObjectId(), name="-", operator=user.id)
+    template = await MissionTemplate.find_one({}) or MissionTemplate(id=PydanticObjectId(), name="-")
+
+    await explain_find("auth.signin / signup", User, {"username": user.username})
+    await explain_find("profile.set_email", User, {"email": user.email or "-"})
+    await explain_find("mission.get_missions", Mission, {"operator": user.id}, sort=[("_id", -1)])
+    await explain_find(
+        "mission.get_missions?mission_status", Mission,
+        {"operator": user.id, "status": "active"}, sort=[("_id", -1)],
+    )
+    await explain_find("mission.new_mission", Mission, {"name": mission.name, "operator": user.id})
+    await explain_find("mission.get_mission steps", Step, {"mission_id": mission.id})
+    await explain_find(
+        "mission.from_template naming", TemplateCounter,
+        {"operator": user.id, "template_name": template.name},
+    )
+    await explain_find(
+        "mission.from_template step templates", StepTemplate,
+        {"mission_template": template.id}, sort=[("order", 1)],
+    )
+    await explain_find(
+        "mission.list_mission_templates steps", StepTemplate,
+        {"mission_template": {"$in": [template.id]}}, sort=[("order", 1)],
+    )
+    await explain_find("location resolution", Location, {"_id": {"$in": [PydanticObjectId()]}})
+    await explain_find("location.create_location", Location, {"name": "-"})
+    await explain_find(
+        "location.list_locations?bbox", Location,
+        {"coordinates": {"$geoWithin": {"$geometry": bbox_polygon((-1.0, 50.0, 0.0, 51.0))}}},
+        sort=[("_id", -1)],
+    )
+    await explain_find(
+        "location.list_locations?near", Location,
+        {"coordinates": {"$near": {"$geometry": {"type": "Point", "coordinates": [-0.43, 50.81]}, "$maxDistance": 5000}}},
+    )
+    await explain_find("step.create_step", Step, {"mission_id": mission.id, "order": 1})
+    await explain_find(
+        "step.proceed_mission_step close", Step,
+        {"mission_id": mission.id, "status": "active"}, sort=[("order", 1)],
+    )
+    await explain_find(
+        "step.proceed_mission_step next", Step,
+        {"mission_id": mission.id, "status": {"$nin": ["done", "skipped", "active"]}, "order": {"$gt": 1}},
+        sort=[("order", 1)],
+    )
+    await explain_aggregate("dashboard.dashboard_event", Mission, active_missions_pipeline(user.id))
+
+    await explain_find("note.list_notes", Note, {"mission_id": mission.id}, sort=[("_id", -1)])
+    await explain_find(
+        "note.list_notes?step_id", Note,
+        {"mission_id": mission.id, "step_id": PydanticObjectId()}, sort=[("_id", -1)],
+    )
+    await explain_aggregate("note.search_notes", Note, [
+        {"$match": {"$text": {"$search": "tesco"}, "operator": user.id}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$sort": {"score": -1, "_id": -1}},
+        {"$limit": 51},
+    ])
+
+    await explain_find("traccar.get_device", Device, {"unique_id": "-"})
+    await explain_find("device.list_devices", Device, {"operator": user.id})
+
+    await explain_find("calendar.feed_version", CalendarFeedVersion, {"_id": user.id})
+    await explain_find("calendar.calendar_feed missions", Mission, {"operator": user.id}, sort=[("_id", 1)])
+    await explain_find(
+        "calendar.calendar_feed steps", Step,
+        {"mission_id": {"$in": [mission.id]}, "planned_start": {"$ne": None}},
+        sort=[("mission_id", 1), ("order", 1)],
+    )
+    await explain_find(
+        "calendar.import_ics missions", Mission,
+        {"operator": user.id, "calendar.feed": "-", "calendar.uid": {"$exists": True}},
+    )
+    await explain_find(
+        "calendar.import_ics steps", Step,
+        {"mission_id": {"$in": [mission.id]}, "calendar.uid": {"$exists": True}},
+    )
+
+    await explain_find("analytics.get_analytics", AnalyticsSummary, {"operator": user.id})
+    await explain_find(
+        "analytics.analyze_mission upsert", AnalyticsSummary,
+        {"operator": user.id, "dimension": "overall", "key": "-"},
+    )
+    await explain_find(
+        "analytics.catch_up", Mission,
+        {"operator": user.id, "status": "completed", "analyzed": {"$ne": True}},
+    )
+
+    await explain_find(
+        "positions.active_steps_by_operator", Mission,
+        {"operator": {"$in": [user.id]}, "status": "active"}, sort=[("start_time", -1)],
+    )
+    await explain_find(
+        "positions.active_steps_by_operator steps", Step,
+        {"mission_id": {"$in": [mission.id]}, "status": "active"},
+    )
+    await explain_find(
+        "Position by operator, time range", Position,
+        {"meta.operator": user.id, "timestamp": {"$gte": mission.id.generation_time}}, sort=[("timestamp", 1)],
+    )
+    await explain_find("tracks.archive_mission_track", Position, {"mission_id": mission.id}, sort=[("timestamp", 1)])
+    await explain_find("tracks.route_segments", Track, {"mission_id": mission.id})
+    await explain_find("tracks.route_segments live", Position, {"mission_id": mission.id}, sort=[("timestamp", 1)])
+    await explain_find("tracks.route_segments?step_id", Track, {"mission_id": mission.id, "step_id": PydanticObjectId()})
+    await close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
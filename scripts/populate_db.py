@@ -1,14 +1,33 @@
 import asyncio
 from beanie import init_beanie
-from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.database import close, connect
+from app.core.migrations import (
+    migrate_duplicate_location_names,
+    migrate_duplicate_step_orders,
+    migrate_location_coordinates,
+)
 from models.models import Location, Step, User, Mission, StepTemplate 
 
-async def seed():
-    # 1. Connect to MongoDB
-    client = AsyncIOMotorClient("mongodb://localhost:27017")
-    await init_beanie(database=client.sentinel_db, document_models=[User, Mission, Step, Location])
 
-    # TODO: Clean existing data
+async def get_or_create_location(name: str, lat: float, lon: float) -> Location:
+    location = await Location.find_one(Location.name == name)
+    if not location:
+        location = await Location(name=name, coordinates={"lat": lat, "lon": lon}).insert()
+        print(f"Inserted location: {name}")
+    return location
+
+
+async def seed():
+    """
+    Seed a development database. Safe to run again: existing documents are
+    looked up by their unique keys and left as they are.
+    """
+    # 1. Connect to MongoDB; legacy documents are fixed up before their indexes are built.
+    db = connect()
+    await migrate_location_coordinates(db)
+    await migrate_duplicate_location_names(db)
+    await migrate_duplicate_step_orders(db)
+    await init_beanie(database=db, document_models=[User, Mission, Step, Location])
 
     # 2. Create default user
     user = await User.find_one({"username": "ihor"})
@@ -30,26 +49,8 @@ async def seed():
             await mt.insert()
             print(f"Inserted template: {m['name']}")
 
-    tesco_location = await Location(
-        **{
-            "name": "Tesco Express Goring",
-            "coordinates": {
-                "lat": 50.8166891,
-                "lon": -0.4306186
-            }
-        }
-    ).insert()
-
-    home_location = await Location(
-        **{
-            "name": "Home",
-            "coordinates": {
-                "lat": 0,
-                "lon": 0
-            }
-        }
-    ).insert()
-    
+    tesco_location = await get_or_create_location("Tesco Express Goring", 50.8166891, -0.4306186)
+    home_location = await get_or_create_location("Home", 0, 0)
 
     small_tesco_walk = await Mission.find_one(Mission.name == default_missions[0]["name"])
     steps = [
@@ -104,12 +105,16 @@ async def seed():
             "location": home_location.id
         }
     ]
+    inserted = 0
     for s in steps:
-        step = Step(**s)
-        await step.insert()
-    print("Inserted default steps for Tesco Walk 1")
+        if await Step.find_one(Step.mission_id == s["mission_id"], Step.order == s["order"]):
+            continue
+        await Step(**s).insert()
+        inserted += 1
+    print(f"Inserted {inserted} default steps for Tesco Walk 1")
 
     print("Database seeding complete")
+    await close()
 
 if __name__ == "__main__":
     asyncio.run(seed())